@@ -0,0 +1,142 @@
+# bench_difficulty_artifacts.py
+# Startup time, steady-state latency and memory of the TF-IDF difficulty model: legacy
+# pickles vs the memory-mapped export. For each format, N worker processes load the
+# artifacts, classify a few questions, time repeated calls on a larger batch, then stay
+# alive together while their memory is read from /proc/self/smaps_rollup. PSS
+# (proportional set size) splits shared pages between the processes mapping them, so it
+# shows how much the mmap format actually shares.
+#
+#   python server/benchmarks/bench_difficulty_artifacts.py --workers 4
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+from bench_hot_paths import synthetic_questions, latency_summary, timed_calls
+
+ServerDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+SAMPLE_TEXTS = [
+    "Choose the correct word: 'I have ___ apple.'",
+    "Identify the dependent clause in: 'Although it was raining, we went for a walk.'",
+    "Explain the grammatical concept of a 'fused participle' and illustrate with an example.",
+]
+
+def memory_snapshot():
+    """RSS / PSS / private memory in kB (Linux); falls back to peak RSS elsewhere."""
+    snapshot = {"max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if parts[0] in ('Rss:', 'Pss:', 'Private_Clean:', 'Private_Dirty:', 'Shared_Clean:'):
+                    snapshot[parts[0].rstrip(':').lower() + '_kb'] = int(parts[1])
+    except OSError:
+        pass
+    return snapshot
+
+def artifact_paths(fmt):
+    sys.path.insert(0, ServerDir)
+    from difficulty_artifacts import MODEL_PATH, VECTORIZER_PATH, MMAP_PATH
+    return [MMAP_PATH] if fmt == 'mmap' else [MODEL_PATH, VECTORIZER_PATH]
+
+def run_worker(fmt, steady_items, steady_calls):
+    started = time.perf_counter()
+    sys.path.insert(0, ServerDir)
+    import joblib
+    import difficulty_classifier
+    from difficulty_artifacts import load_mmap_artifacts, MMAP_PATH
+    imported = time.perf_counter()
+
+    if fmt == 'mmap':
+        model, vectorizer = load_mmap_artifacts(MMAP_PATH)
+    else:
+        model = joblib.load(difficulty_classifier.MODEL_PATH)
+        vectorizer = joblib.load(difficulty_classifier.VECTORIZER_PATH)
+    loaded = time.perf_counter()
+
+    model.predict(vectorizer.transform(SAMPLE_TEXTS))
+    first_prediction = time.perf_counter()
+
+    # What every request pays once the process is warm
+    texts = [q["question"] for q in synthetic_questions(steady_items)]
+    steady = latency_summary(timed_calls(lambda: model.predict(vectorizer.transform(texts)), steady_calls),
+                             steady_items)
+
+    report = {
+        "format": fmt,
+        "pid": os.getpid(),
+        "import_seconds": round(imported - started, 4),
+        "load_seconds": round(loaded - imported, 4),
+        "first_prediction_seconds": round(first_prediction - loaded, 4),
+        "steady_state": steady,
+    }
+    report.update(memory_snapshot())
+    print(json.dumps(report), flush=True)
+
+    # Stay alive until the parent has measured every worker of this round
+    sys.stdin.read()
+
+def run_round(fmt, workers, steady_items, steady_calls):
+    missing = [path for path in artifact_paths(fmt) if not os.path.exists(path)]
+    if missing:
+        print(f"Skipping {fmt}: {', '.join(missing)} not found", file=sys.stderr)
+        return {"format": fmt, "skipped": f"missing {', '.join(missing)}"}
+
+    procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__), '--worker', fmt,
+                               '--steady-items', str(steady_items), '--steady-calls', str(steady_calls)],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+             for _ in range(workers)]
+    lines = [p.stdout.readline() for p in procs]
+    for p in procs:
+        p.stdin.close()
+        p.wait()
+    if not all(lines):
+        return {"format": fmt, "error": "a worker exited without a report (see stderr)"}
+    reports = [json.loads(line) for line in lines]
+
+    def total(field):
+        return sum(r.get(field, 0) for r in reports)
+
+    def mean(field):
+        return round(sum(r[field] for r in reports) / len(reports), 4)
+
+    return {
+        "format": fmt,
+        "workers": workers,
+        "mean_load_seconds": mean("load_seconds"),
+        "mean_first_prediction_seconds": mean("first_prediction_seconds"),
+        "mean_steady_p50_ms": round(sum(r["steady_state"]["p50_ms"] for r in reports) / len(reports), 3),
+        "total_rss_kb": total("rss_kb"),
+        "total_pss_kb": total("pss_kb"),
+        "total_private_kb": total("private_clean_kb") + total("private_dirty_kb"),
+        "per_worker": reports,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare pickle vs memory-mapped difficulty artifacts.")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--steady-items', type=int, default=500,
+                        help="Questions per steady-state call (default: %(default)s).")
+    parser.add_argument('--steady-calls', type=int, default=20,
+                        help="Timed steady-state calls per worker (default: %(default)s).")
+    parser.add_argument('--worker', choices=['pickle', 'mmap'], help=argparse.SUPPRESS)
+    parser.add_argument('--output', help="Also write the JSON report to this file.")
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.steady_items, args.steady_calls)
+        return
+
+    results = [run_round(fmt, args.workers, args.steady_items, args.steady_calls) for fmt in ('pickle', 'mmap')]
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+
+if __name__ == "__main__":
+    main()
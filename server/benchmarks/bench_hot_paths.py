@@ -0,0 +1,244 @@
+# bench_hot_paths.py
+# Latency and throughput of the classification and bandit hot paths, fully offline:
+#
+#   transformer  transformer_classifier.predict on a small randomly initialised
+#                DeBERTa-v2-shaped model (the real tokenizer from ml_model/, no weights needed)
+#   tfidf        difficulty_classifier.classify_questions on the TF-IDF artifacts
+#   bandit       mab_model.get_next_difficulty / update_bandit on synthetic students,
+#                per store backend, history length and student count
+#
+# Every case runs in its own process, so each gets a clean import (the bandit settings are
+# read from the environment at import time) and its own peak RSS. Each case reports
+# p50/p95/p99 latency per call, items per second and peak RSS; the whole run is written as
+# JSON together with the git commit, so two runs can be compared:
+#
+#   python server/benchmarks/bench_hot_paths.py --output before.json
+#   python server/benchmarks/bench_hot_paths.py --output after.json --compare before.json
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+import statistics
+import subprocess
+from contextlib import redirect_stdout
+
+ServerDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+MabDir = os.path.join(ServerDir, 'mab')
+
+WORDS = ("the students have been reading a very short story about grammar tenses clauses "
+         "which whose although because when choose correct word sentence identify explain").split()
+
+def synthetic_questions(count, seed=0):
+    rng = random.Random(seed)
+    return [{
+        "question": " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 40))) + "?",
+        "options": [" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))) for _ in range(4)],
+    } for _ in range(count)]
+
+def latency_summary(seconds, items_per_call):
+    """p50/p95/p99 latency in ms over the timed calls, plus throughput."""
+    cuts = statistics.quantiles(seconds, n=100, method='inclusive') if len(seconds) > 1 else seconds * 99
+    total = sum(seconds)
+    return {
+        "calls": len(seconds),
+        "p50_ms": round(cuts[49] * 1000, 3),
+        "p95_ms": round(cuts[94] * 1000, 3),
+        "p99_ms": round(cuts[98] * 1000, 3),
+        "items_per_second": round(items_per_call * len(seconds) / total, 1) if total else None,
+    }
+
+def timed_calls(fn, repeats, warmup=1):
+    for _ in range(warmup):
+        fn()
+    seconds = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - started)
+    return seconds
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+# -------------------------
+# Cases (each runs inside its own worker process)
+# -------------------------
+def run_transformer(case):
+    sys.path.insert(0, ServerDir)
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification, DebertaV2Config
+    import transformer_classifier
+
+    torch.manual_seed(0)
+    tokenizer = AutoTokenizer.from_pretrained(transformer_classifier.ModelDir)
+    # DeBERTa-v2 architecture at a fraction of the size: same code paths, random weights
+    config = DebertaV2Config(vocab_size=len(tokenizer), hidden_size=128, num_hidden_layers=2,
+                             num_attention_heads=2, intermediate_size=512, num_labels=8)
+    model = AutoModelForSequenceClassification.from_config(config).eval()
+
+    questions = synthetic_questions(case["items"])
+    seconds = timed_calls(
+        lambda: transformer_classifier.predict(questions, tokenizer, model, batch_size=case["batch_size"]),
+        case["repeats"])
+    return latency_summary(seconds, case["items"])
+
+def run_tfidf(case):
+    sys.path.insert(0, ServerDir)
+    import difficulty_classifier
+
+    pickles = [difficulty_classifier.MODEL_PATH, difficulty_classifier.VECTORIZER_PATH]
+    if not os.path.exists(difficulty_classifier.MMAP_PATH) and not all(os.path.exists(path) for path in pickles):
+        return {"skipped": "TF-IDF artifacts not found (needs the mmap export or both pickles)"}
+    difficulty_classifier.load_artifacts()
+
+    questions = [{"text": q["question"], "options": q["options"]} for q in synthetic_questions(case["items"])]
+    seconds = timed_calls(lambda: difficulty_classifier.classify_questions(questions), case["repeats"])
+    return latency_summary(seconds, case["items"])
+
+def run_bandit(case):
+    workdir = tempfile.mkdtemp(prefix="bench_bandit_")
+    os.chdir(workdir)
+    os.environ.update({
+        "BANDIT_STORE": case["store"],
+        "BANDIT_DB_PATH": os.path.join(workdir, "bandit_models", "bandit.db"),
+        "BANDIT_STATE_CACHE_SIZE": str(case.get("cache_size", 0)),
+    })
+    sys.path.insert(0, MabDir)
+
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        import mab_model
+
+        rng = random.Random(0)
+        students = [f"student-{i}" for i in range(case["students"])]
+        started = time.perf_counter()
+        for student_id in students:
+            history = {"decisions": [rng.choice(mab_model.arms) for _ in range(case["history"])],
+                       "rewards": [rng.randint(0, 1) for _ in range(case["history"])]}
+            state = mab_model.state_from_history(history)
+            state["version"] = case["history"]
+            mab_model.get_bandit_store().import_student(student_id, state, history)
+        prefill_seconds = time.perf_counter() - started
+
+        next_seconds = timed_calls(lambda: mab_model.get_next_difficulty(rng.choice(students)), case["repeats"])
+        update_seconds = timed_calls(
+            lambda: mab_model.update_bandit(rng.choice(students), rng.choice(mab_model.arms), rng.randint(0, 1)),
+            case["repeats"])
+
+    return {
+        "prefill_seconds": round(prefill_seconds, 3),
+        "get_next_difficulty": latency_summary(next_seconds, 1),
+        "update_bandit": latency_summary(update_seconds, 1),
+    }
+
+RUNNERS = {"transformer": run_transformer, "tfidf": run_tfidf, "bandit": run_bandit}
+
+def build_cases(args):
+    cases = []
+    if "transformer" in args.suites:
+        for batch_size in args.batch_sizes:
+            cases.append({"suite": "transformer", "batch_size": batch_size, "items": args.items,
+                          "repeats": args.repeats})
+    if "tfidf" in args.suites:
+        for items in args.batch_sizes:
+            cases.append({"suite": "tfidf", "items": items, "repeats": args.repeats})
+    if "bandit" in args.suites:
+        for store in args.stores:
+            for history in args.history_lengths:
+                for students in args.student_counts:
+                    cases.append({"suite": "bandit", "store": store, "history": history,
+                                  "students": students, "repeats": args.bandit_repeats})
+    return cases
+
+def run_case(case):
+    """Run one case in a fresh interpreter and return its JSON report."""
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', json.dumps(case)],
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {**case, "error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ServerDir,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def case_key(result):
+    return json.dumps({k: v for k, v in result.items() if k in
+                       ("suite", "batch_size", "items", "store", "history", "students")}, sort_keys=True)
+
+def compare(results, baseline_path):
+    """Print the p50 / throughput change of every case also present in the baseline run."""
+    with open(baseline_path) as f:
+        baseline = {case_key(r): r for r in json.load(f)["results"]}
+
+    for result in results:
+        old = baseline.get(case_key(result))
+        if not old:
+            continue
+        for section in ("", "get_next_difficulty", "update_bandit"):
+            new_stats = result.get(section) if section else result
+            old_stats = old.get(section) if section else old
+            if not new_stats or not old_stats or "p50_ms" not in new_stats or "p50_ms" not in old_stats:
+                continue
+            change = (new_stats["p50_ms"] - old_stats["p50_ms"]) / old_stats["p50_ms"] * 100 if old_stats["p50_ms"] else 0
+            print(f"{case_key(result)} {section}: p50 {old_stats['p50_ms']} -> {new_stats['p50_ms']} ms "
+                  f"({change:+.1f}%)", file=sys.stderr)
+
+def int_list(value):
+    return [int(v) for v in value.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the classification and bandit hot paths.")
+    parser.add_argument('--suites', default='transformer,tfidf,bandit',
+                        type=lambda v: v.split(','))
+    parser.add_argument('--batch-sizes', default='1,8,32,64', type=int_list,
+                        help="transformer: predict() batch size; tfidf: questions per call.")
+    parser.add_argument('--items', type=int, default=256, help="Questions per transformer predict() call.")
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--stores', default='sqlite,file', type=lambda v: v.split(','))
+    parser.add_argument('--history-lengths', default='0,100,1000', type=int_list)
+    parser.add_argument('--student-counts', default='100,5000', type=int_list)
+    parser.add_argument('--bandit-repeats', type=int, default=1000)
+    parser.add_argument('--output', help="Write the JSON report to this file.")
+    parser.add_argument('--compare', help="Earlier JSON report to compare p50 latencies against.")
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        case = json.loads(args.case)
+        report = {**case, **RUNNERS[case["suite"]](case), "peak_rss_kb": peak_rss_kb()}
+        print(json.dumps(report), flush=True)
+        return
+
+    results = []
+    for case in build_cases(args):
+        result = run_case(case)
+        results.append(result)
+        print(json.dumps(result), file=sys.stderr, flush=True)
+
+    report = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# cascade_classifier.py
+# Confidence-gated cascade: every question is scored by the cheap TF-IDF model first and
+# only the ones it is unsure about are escalated to the DeBERTa transformer, so most easy
+# questions never touch the large model (which is not even loaded if nothing escalates).
+#
+# The two models predict different fields: the transformer checkpoint only has a topic
+# head (its difficulty is a constant 3), TF-IDF only predicts difficulty. So difficulty
+# always comes from TF-IDF when it can score, and escalation only contributes the topic;
+# the transformer's difficulty is used only when TF-IDF is unavailable altogether.
+import sys
+import json
+import argparse
+
+import difficulty_classifier
+from prediction_cache import open_cache, DEFAULT_CACHE_PATH
+
+DEFAULT_THRESHOLD = 0.75
+
+def tfidf_scores(texts):
+    """Return (labels, confidences) from the TF-IDF model, or None if it can't score."""
+    try:
+        model, vectorizer = difficulty_classifier.load_artifacts()
+    except Exception as e:
+        print(f"TF-IDF model unavailable, escalating everything: {str(e)}", file=sys.stderr)
+        return None
+
+    if not hasattr(model, 'predict_proba'):
+        print("TF-IDF model has no predict_proba, escalating everything", file=sys.stderr)
+        return None
+
+    proba = model.predict_proba(vectorizer.transform(texts))
+    best = proba.argmax(axis=1)
+    labels = [model.classes_[i] for i in best]
+    confidences = [float(proba[row, i]) for row, i in enumerate(best)]
+    return labels, confidences
+
+def cascade_classify(questions, threshold=DEFAULT_THRESHOLD, escalate=None):
+    """
+    Classify questions ({"question", "options"}) through the cascade. Escalated results
+    take the transformer's topic and keep the TF-IDF difficulty (difficulty_source).
+    escalate(questions) runs the transformer on the low-confidence subset; by default
+    it loads transformer_classifier on first use. Returns (results, stats).
+    """
+    texts = [q.get('question') or q.get('text', '') for q in questions]
+    results = [None] * len(questions)
+    escalated = []
+
+    scores = tfidf_scores(texts) if texts else None
+    for i in range(len(questions)):
+        if scores is None:
+            escalated.append(i)
+            continue
+
+        label, confidence = scores[0][i], scores[1][i]
+        if confidence >= threshold:
+            results[i] = {
+                "topic": "General Grammar", # Simplified
+                "difficulty": difficulty_classifier.to_difficulty(label),
+                "confidence": round(confidence, 4),
+                "source": "tfidf"
+            }
+        else:
+            escalated.append(i)
+
+    if escalated:
+        subset = [questions[i] for i in escalated]
+        try:
+            escalate = escalate or default_escalate()
+            transformer_results = escalate(subset)
+        except Exception as e:
+            print(f"Transformer unavailable for escalated questions: {str(e)}", file=sys.stderr)
+            transformer_results = [{"topic": "General Grammar", "difficulty": 3, "mock": True,
+                                    "error": "Model unavailable"} for _ in subset]
+
+        for i, result in zip(escalated, transformer_results):
+            result = dict(result, source="transformer")
+            if scores is not None:
+                # Keep TF-IDF's difficulty even when unsure; the transformer has no difficulty head
+                result["difficulty"] = difficulty_classifier.to_difficulty(scores[0][i])
+                result["difficulty_source"] = "tfidf"
+                result["confidence"] = round(scores[1][i], 4)
+            results[i] = result
+
+    total = len(questions)
+    stats = {
+        "total": total,
+        "escalated": len(escalated),
+        "escalation_rate": round(len(escalated) / total, 4) if total else 0.0,
+        "threshold": threshold
+    }
+    return results, stats
+
+def default_escalate(backend='torch', cache_path=DEFAULT_CACHE_PATH, use_cache=True):
+    """Build an escalate() that runs transformer_classifier behind its prediction cache."""
+    # Imported lazily: a fully confident batch never pays for torch/transformers
+    import transformer_classifier
+
+    namespace = 'transformer' if backend == 'torch' else f"transformer:{backend}"
+    cache = open_cache([transformer_classifier.ModelDir], namespace, cache_path) if use_cache else None
+    loaded = []
+
+    def get_model():
+        if not loaded:
+            loaded.append(transformer_classifier.load_classifier(backend))
+        return loaded[0]
+
+    return lambda subset: transformer_classifier.classify(subset, get_model, cache)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Classify questions with TF-IDF first, DeBERTa only when unsure.")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Minimum TF-IDF confidence to accept without escalation (default: %(default)s).")
+    parser.add_argument('--backend', default='torch',
+                        help="Inference backend for escalated questions (default: %(default)s).")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Skip the on-disk prediction cache for escalated questions.")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        input_data = sys.stdin.read()
+        if not input_data:
+            print(json.dumps([]))
+            sys.exit(0)
+
+        questions = json.loads(input_data).get('questions', [])
+        escalate = lambda subset: default_escalate(args.backend, use_cache=not args.no_cache)(subset)
+        results, stats = cascade_classify(questions, args.threshold, escalate)
+
+        # Results keep the transformer_classifier.py output shape; the summary goes to stderr
+        print(json.dumps({"cascade": stats}), file=sys.stderr)
+        print(json.dumps(results))
+    except Exception as e:
+        print(json.dumps({"error": f"Unexpected error: {str(e)}"}), file=sys.stderr)
+        sys.exit(1)
@@ -2,47 +2,11 @@ const XLSX = require('xlsx');
 const path = require('path');
 const fs = require('fs');
 const { v4: uuidv4 } = require('uuid');
-const { spawn } = require('child_process');
+const classifierService = require('../services/classifierService');
 
+// Classification runs in the long-lived worker managed by classifierService
 function classifyQuestionsBatch(questions) {
-    return new Promise((resolve, reject) => {
-        const scriptPath = path.join(__dirname, '..', 'transformer_classifier.py');
-        const pythonExecutable = process.platform === 'win32'
-            ? path.join(__dirname, '..', '..', 'venv', 'Scripts', 'python.exe')
-            : path.join(__dirname, '..', '..', 'venv', 'bin', 'python');
-
-        const pythonCmd = fs.existsSync(pythonExecutable) ? pythonExecutable : 'python';
-        const pythonProcess = spawn(pythonCmd, [scriptPath]);
-
-        let output = '';
-        let errorOutput = '';
-
-        pythonProcess.stdout.on('data', (data) => output += data.toString());
-        pythonProcess.stderr.on('data', (data) => errorOutput += data.toString());
-
-        pythonProcess.on('close', (code) => {
-            if (code !== 0) {
-                console.warn(`AI Classifier exited with code ${code}. Error: ${errorOutput}. Using defaults.`);
-                return resolve(questions.map(() => ({ topic: 'General Grammar', difficulty: 3 })));
-            }
-            try {
-                const results = JSON.parse(output);
-                resolve(results);
-            } catch (e) {
-                console.error(`Invalid JSON from AI: "${output}".`);
-                resolve(questions.map(() => ({ topic: 'General Grammar', difficulty: 3 })));
-            }
-        });
-
-        pythonProcess.on('error', (err) => {
-            console.error('Failed to spawn python:', err);
-            resolve(questions.map(() => ({ topic: 'General Grammar', difficulty: 3 })));
-        });
-
-        const inputData = { questions: questions.map(q => ({ question: q.text, options: q.options || [] })) };
-        pythonProcess.stdin.write(JSON.stringify(inputData));
-        pythonProcess.stdin.end();
-    });
+    return classifierService.classify(questions);
 }
 
 exports.uploadQuestionSet = async (req, res, pool) => {
@@ -0,0 +1,89 @@
+# difficulty_artifacts.py
+# Memory-mappable storage for the TF-IDF difficulty model.
+#
+# The pickled vectorizer keeps its vocabulary in a Python dict, which every process has to
+# unpickle on load. Here the vocabulary is stored as two numpy arrays (sorted terms +
+# feature indices) and everything is written with an uncompressed joblib dump, so
+# joblib.load(..., mmap_mode='r') maps the coefficient, idf and vocabulary arrays straight
+# from the page cache: several workers on one host share the same physical pages instead
+# of each holding a private copy. Only the term lookup dict is per process, built from the
+# mapped arrays on the first transform() rather than at load.
+import os
+import sys
+import copy
+import time
+from collections.abc import Mapping
+
+import numpy as np
+import joblib
+
+BaseDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+MODEL_PATH = os.path.join(BaseDir, 'difficulty_model.pkl')
+VECTORIZER_PATH = os.path.join(BaseDir, 'tfidf_vectorizer.pkl')
+MMAP_PATH = os.path.join(BaseDir, 'difficulty_artifacts.joblib')
+
+class ArrayVocabulary(Mapping):
+    """
+    Read-only term -> feature index mapping stored as sorted numpy arrays. transform() looks
+    up every token, so the first lookup builds a private dict from the mapped arrays (a
+    searchsorted per token is ~5x slower); it is never written back into the artifact file.
+    """
+
+    def __init__(self, vocabulary):
+        terms = sorted(vocabulary)
+        self.terms = np.array(terms, dtype=str)
+        self.indices = np.array([vocabulary[t] for t in terms], dtype=np.int64)
+        self._lookup = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_lookup', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lookup = None
+
+    def __getitem__(self, term):
+        if self._lookup is None:
+            self._lookup = dict(zip(self.terms.tolist(), self.indices.tolist()))
+        return self._lookup[term]
+
+    def __contains__(self, term):
+        try:
+            self[term]
+            return True
+        except KeyError:
+            return False
+
+    def __iter__(self):
+        return (str(t) for t in self.terms)
+
+    def __len__(self):
+        return len(self.terms)
+
+def export_mmap_artifacts(model, vectorizer, out_path=MMAP_PATH):
+    """Write model + vectorizer in the memory-mappable layout (the vectorizer passed in is left as is)."""
+    vectorizer = copy.copy(vectorizer)
+    vectorizer.vocabulary_ = ArrayVocabulary(vectorizer.vocabulary_)
+    # stop_words_ only serves introspection and can be large; sklearn documents it as safe to drop
+    if hasattr(vectorizer, 'stop_words_'):
+        delattr(vectorizer, 'stop_words_')
+
+    # Uncompressed on purpose: compressed joblib files can't be memory-mapped
+    joblib.dump({"model": model, "vectorizer": vectorizer, "exported_at": time.time()}, out_path)
+    return out_path
+
+def convert_pickles(model_path=MODEL_PATH, vectorizer_path=VECTORIZER_PATH, out_path=MMAP_PATH):
+    """Convert the legacy pickle pair into the memory-mappable file."""
+    model = joblib.load(model_path)
+    vectorizer = joblib.load(vectorizer_path)
+    return export_mmap_artifacts(model, vectorizer, out_path)
+
+def load_mmap_artifacts(path=MMAP_PATH):
+    bundle = joblib.load(path, mmap_mode='r')
+    return bundle["model"], bundle["vectorizer"]
+
+if __name__ == "__main__":
+    out = convert_pickles()
+    print(f"Wrote {out}", file=sys.stderr)
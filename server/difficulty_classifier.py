@@ -1,44 +1,121 @@
 # difficulty_classifier.py
 import sys
 import json
-import pickle
 import os
+import argparse
+import joblib
 import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.ensemble import RandomForestClassifier
 
+from question_format import format_input
+from prediction_cache import open_cache, cached_predict
+from ndjson_stream import stream_classify
+from difficulty_artifacts import MMAP_PATH, load_mmap_artifacts, convert_pickles
+
 # Load model and vectorizer
 MODEL_PATH = os.path.join(os.path.dirname(__file__), '..', 'difficulty_model.pkl')
 VECTORIZER_PATH = os.path.join(os.path.dirname(__file__), '..', 'tfidf_vectorizer.pkl')
 
-def classify_questions(questions):
+DEFAULT_STREAM_BATCH_SIZE = 256
+
+# train_difficulty_model.py labels questions easy/medium/hard; the app uses 1-5
+DIFFICULTY_LEVELS = {'easy': 1, 'medium': 3, 'hard': 5}
+
+# Module-level cache: (paths + mtimes it was loaded from, (model, vectorizer))
+_artifacts = None
+_artifacts_key = None
+
+def artifacts_key():
+    """
+    Identify the artifacts on disk; a changed mtime means the model was retrained.
+    The mmap export is only used while it is at least as new as the pickles, so pickles
+    replaced some other way (copied in, older training workflow) are not shadowed by it.
+    """
+    pickles = [path for path in (MODEL_PATH, VECTORIZER_PATH) if os.path.exists(path)]
+    newest_pickle = max((os.path.getmtime(path) for path in pickles), default=0)
+    if os.path.exists(MMAP_PATH) and os.path.getmtime(MMAP_PATH) >= newest_pickle:
+        paths = [MMAP_PATH]
+    else:
+        paths = [MODEL_PATH, VECTORIZER_PATH]
+    return tuple((path, os.path.getmtime(path)) for path in paths)
+
+def load_artifacts():
+    """
+    Load the model and vectorizer once per process, reloading only when the files change.
+    The memory-mapped export (difficulty_artifacts.py) is preferred over the pickles.
+    """
+    global _artifacts, _artifacts_key
+    key = artifacts_key()
+    if _artifacts is None or key != _artifacts_key:
+        if key[0][0] == MMAP_PATH:
+            _artifacts = load_mmap_artifacts(MMAP_PATH)
+        else:
+            # joblib.load also reads plain pickles, and the training script writes with joblib
+            _artifacts = (joblib.load(MODEL_PATH), joblib.load(VECTORIZER_PATH))
+        _artifacts_key = key
+    return _artifacts
+
+def to_difficulty(label):
+    """Map a model label (numeric or easy/medium/hard) onto the 1-5 difficulty scale."""
+    if isinstance(label, str) and label.lower() in DIFFICULTY_LEVELS:
+        return DIFFICULTY_LEVELS[label.lower()]
+    return int(label)
+
+def classify_questions(questions, cache=None):
     try:
-        # Load artifacts
-        with open(MODEL_PATH, 'rb') as f:
-            model = pickle.load(f)
-        with open(VECTORIZER_PATH, 'rb') as f:
-            vectorizer = pickle.load(f)
-
-        results = []
-        texts = [q['text'] for q in questions]
-        
-        # Transform and Predict
-        features = vectorizer.transform(texts)
-        predictions = model.predict(features)
-        
-        for i, pred in enumerate(predictions):
-            results.append({
-                'topic': 'General Grammar', # Simplified
-                'difficulty': int(pred)
-            })
-            
-        return results
+        def compute(missing):
+            # Load artifacts (only reached when something missed the cache)
+            model, vectorizer = load_artifacts()
+
+            results = []
+            texts = [questions[i]['text'] for i in missing]
+
+            # Transform and Predict
+            features = vectorizer.transform(texts)
+            predictions = model.predict(features)
+
+            for i, pred in enumerate(predictions):
+                results.append({
+                    'topic': 'General Grammar', # Simplified
+                    'difficulty': to_difficulty(pred)
+                })
+
+            return results
+
+        keys = [format_input(q['text'], q.get('options', [])) for q in questions]
+        return cached_predict(cache, keys, compute)
 
     except Exception as e:
         # Fallback
         return [{'topic': 'General Grammar', 'difficulty': 3} for _ in questions]
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Classify question difficulty with the TF-IDF model.")
+    parser.add_argument('--stream', action='store_true',
+                        help="Read one question per line (NDJSON) and write each prediction as its batch finishes.")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_STREAM_BATCH_SIZE,
+                        help="Questions per batch in --stream mode (default: %(default)s).")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Skip the on-disk prediction cache.")
+    parser.add_argument('--export-mmap', action='store_true',
+                        help="Convert the pickled model/vectorizer into the memory-mappable artifact file.")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    args = parse_args()
+
+    if args.export_mmap:
+        print(json.dumps({"written": convert_pickles(MODEL_PATH, VECTORIZER_PATH, MMAP_PATH)}))
+        sys.exit(0)
+
+    cache = None if args.no_cache else open_cache([MODEL_PATH, VECTORIZER_PATH, MMAP_PATH], 'difficulty')
+
+    if args.stream:
+        # classify_questions already falls back to neutral defaults per batch
+        stream_classify(lambda batch: classify_questions(batch, cache), args.batch_size)
+        sys.exit(0)
+
     try:
         input_data = sys.stdin.read()
         if not input_data:
@@ -47,7 +124,7 @@ if __name__ == "__main__":
         data = json.loads(input_data)
         questions = data.get('questions', [])
         
-        results = classify_questions(questions)
+        results = classify_questions(questions, cache)
         print(json.dumps(results))
     except Exception as e:
         print(json.dumps([]))
@@ -0,0 +1,151 @@
+# embedding_index.py
+# Persistent vector index of question embeddings, for reusing labels of near-duplicates.
+#
+# Faculty often upload lightly edited copies of existing questions. The classifier worker
+# mean-pools the encoder's last hidden state into one L2-normalised vector per question;
+# this index stores those vectors (float32 rows in an append-only file, read through a
+# memmap) next to the labels the question was saved with. A new question whose cosine
+# similarity to an indexed one reaches the threshold takes over that question's topic and
+# difficulty, so copies are labelled consistently with what faculty already accepted.
+#
+# Search is exact: a chunked matrix product over the memmap, which stays fast well into
+# hundreds of thousands of questions. One index directory exists per model fingerprint,
+# since embeddings of another model are not comparable.
+import os
+import sys
+import json
+import hashlib
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: inserts are then only safe from a single process
+    fcntl = None
+
+from prediction_cache import model_fingerprint
+
+ScriptDir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INDEX_ROOT = os.environ.get('EMBEDDING_INDEX_PATH', os.path.join(ScriptDir, 'cache', 'embedding_index'))
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+# Rows scored per matrix product; bounds the temporary similarity matrix
+SEARCH_CHUNK_ROWS = 65536
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class EmbeddingIndex:
+    """Append-only float32 vectors + one JSON line of labels per row."""
+
+    def __init__(self, path, dim, threshold=DEFAULT_SIMILARITY_THRESHOLD):
+        self.path = path
+        self.dim = dim
+        self.threshold = threshold
+        os.makedirs(path, exist_ok=True)
+        self.vectors_path = os.path.join(path, 'vectors.f32')
+        self.entries_path = os.path.join(path, 'entries.ndjson')
+        self.entries = []
+        self.hashes = set()
+        self._entries_size = 0
+        self._vectors = None
+        self.refresh()
+
+    def refresh(self):
+        """Pick up rows inserted since the last look (by this or another process)."""
+        if not os.path.exists(self.entries_path):
+            return
+        with open(self.entries_path, 'rb') as f:
+            f.seek(self._entries_size)
+            for line in f:
+                # A line without its newline is still being written
+                if not line.endswith(b'\n'):
+                    break
+                entry = json.loads(line)
+                self.entries.append(entry)
+                self.hashes.add(entry['hash'])
+                self._entries_size += len(line)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def vectors(self):
+        """Memmap of the rows that have labels (vectors are written before their entry line)."""
+        rows = len(self.entries)
+        if rows == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        if self._vectors is None or self._vectors.shape[0] < rows:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r').reshape(-1, self.dim)
+        return self._vectors[:rows]
+
+    def search(self, queries):
+        """Best match per query row: (row indices, cosine similarities); -1 / -inf on an empty index."""
+        self.refresh()
+        queries = np.asarray(queries, dtype=np.float32)
+        best_rows = np.full(len(queries), -1, dtype=np.int64)
+        best_scores = np.full(len(queries), -np.inf, dtype=np.float32)
+
+        vectors = self.vectors()
+        for start in range(0, len(vectors), SEARCH_CHUNK_ROWS):
+            scores = queries @ vectors[start:start + SEARCH_CHUNK_ROWS].T
+            rows = scores.argmax(axis=1)
+            top = scores[np.arange(len(queries)), rows]
+            better = top > best_scores
+            best_rows[better] = rows[better] + start
+            best_scores[better] = top[better]
+        return best_rows, best_scores
+
+    def lookup(self, queries, threshold=None):
+        """Per query, the stored entry (with its similarity) if one is close enough, else None."""
+        threshold = self.threshold if threshold is None else threshold
+        rows, scores = self.search(queries)
+        return [dict(self.entries[row], similarity=round(float(score), 4)) if row >= 0 and score >= threshold else None
+                for row, score in zip(rows, scores)]
+
+    def add(self, texts, vectors, labels):
+        """Insert questions not indexed yet; labels are dicts with topic/difficulty."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with open(os.path.join(self.path, '.lock'), 'w') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            self.refresh()
+
+            # Drop vectors of an insert that died before writing its entry lines
+            with open(self.vectors_path, 'ab') as f:
+                f.truncate(len(self.entries) * self.dim * 4)
+
+            rows, lines = [], []
+            for text, vector, label in zip(texts, vectors, labels):
+                digest = text_hash(text)
+                if digest in self.hashes:
+                    continue
+                self.hashes.add(digest)
+                rows.append(vector)
+                lines.append(json.dumps({"hash": digest, "topic": label.get('topic'),
+                                         "difficulty": label.get('difficulty')}) + "\n")
+            if not rows:
+                return 0
+
+            with open(self.vectors_path, 'ab') as f:
+                f.write(np.stack(rows).astype(np.float32).tobytes())
+            with open(self.entries_path, 'a') as f:
+                f.writelines(lines)
+            self.refresh()
+            return len(rows)
+
+def mean_pool(hidden_states, attention_mask):
+    """Masked mean over tokens, L2-normalised, as float32 numpy (batch, hidden)."""
+    mask = attention_mask.unsqueeze(-1).to(hidden_states.dtype)
+    pooled = (hidden_states * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+    pooled = pooled / pooled.norm(dim=-1, keepdim=True).clamp(min=1e-12)
+    return pooled.float().cpu().numpy()
+
+def open_embedding_index(model_dir, dim, threshold=DEFAULT_SIMILARITY_THRESHOLD, root=DEFAULT_INDEX_ROOT):
+    """The index for this model, or None if it can't be opened (classification still works)."""
+    try:
+        fingerprint = model_fingerprint(model_dir)
+        return EmbeddingIndex(os.path.join(root, fingerprint[:16]), dim, threshold)
+    except (OSError, ValueError) as e:
+        print(f"Embedding index disabled: {str(e)}", file=sys.stderr)
+        return None
@@ -0,0 +1,174 @@
+# inference_backends.py
+# CPU inference backends for the DeBERTa question classifier.
+#
+#   torch       - the fp32 PyTorch checkpoint in ml_model/ (reference)
+#   torch-int8  - PyTorch dynamic int8 quantization of the Linear layers
+#   onnx        - exported ONNX graph run with onnxruntime
+#
+# Every backend is returned as an object that predict() can call like the Hugging Face
+# model: model(**inputs).logits and model.config.id2label both work.
+import os
+import sys
+import json
+from types import SimpleNamespace
+
+import torch
+
+from prediction_cache import model_fingerprint
+
+ScriptDir = os.path.dirname(os.path.abspath(__file__))
+ModelDir = os.path.join(ScriptDir, 'ml_model')
+# Converted artifacts live next to ml_model/ so the original checkpoint stays untouched
+ExportDir = os.path.join(ScriptDir, 'ml_model_optimized')
+ONNX_PATH = os.path.join(ExportDir, 'model.onnx')
+INT8_PATH = os.path.join(ExportDir, 'model_int8.pt')
+MANIFEST_PATH = os.path.join(ExportDir, 'manifest.json')
+
+BACKENDS = ['torch', 'torch-int8', 'onnx']
+ONNX_OPSET = 14
+
+# Short, varied questions used when no parity input is given
+PARITY_SAMPLES = [
+    {"question": "Choose the correct word: 'I have ___ apple.'", "options": ["a", "an", "the", "no article"]},
+    {"question": "What is the past tense of 'go'?", "options": ["goed", "went", "gone", "going"]},
+    {"question": "Identify the dependent clause in: 'Although it was raining, we went for a walk.'",
+     "options": ["Although it was raining", "we went", "for a walk", "it was"]},
+    {"question": "Which word means 'a strong feeling of dislike'?", "options": ["antipathy", "apathy", "sympathy", "empathy"]},
+    {"question": "Rewrite to fix the dangling participle: 'Having finished the assignment, the TV was turned on.'",
+     "options": ["Having finished the assignment, I turned on the TV.", "The TV was turned on, having finished.",
+                 "Having finished, the TV turned on.", "No change needed."]},
+    {"question": "Select the correct preposition: 'The book is ___ the table.'", "options": ["on", "in", "at", "by"]},
+]
+
+def configure_threads(intra_op_threads=None, inter_op_threads=None):
+    """Apply torch thread-pool sizes (onnxruntime gets its own in the session options)."""
+    if intra_op_threads:
+        torch.set_num_threads(intra_op_threads)
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError:
+            # Can only be set once, before any inter-op work has started
+            print("inter-op threads already initialised; keeping current setting", file=sys.stderr)
+
+def read_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH) as f:
+        return json.load(f)
+
+def check_export_is_current():
+    """
+    Whether the exported artifacts were produced from the current ml_model checkpoint.
+    The prediction cache is keyed on ml_model/ alone, so a stale export must not be used.
+    """
+    manifest = read_manifest()
+    return bool(manifest) and manifest.get('source_fingerprint') == model_fingerprint(ModelDir)
+
+def quantize_int8(model):
+    """Dynamic int8 quantization: weights stored as int8, activations quantized on the fly."""
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+class OnnxSequenceClassifier:
+    """onnxruntime session with the calling convention of AutoModelForSequenceClassification."""
+
+    def __init__(self, path, config, intra_op_threads=None, inter_op_threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise RuntimeError(f"The onnx backend needs onnxruntime: {str(e)}")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads:
+            options.inter_op_num_threads = inter_op_threads
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.config = config
+
+    def __call__(self, **inputs):
+        feed = {name: inputs[name].cpu().numpy() for name in self.input_names if name in inputs}
+        (logits,) = self.session.run(['logits'], feed)
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+    def eval(self):
+        return self
+
+def load_backend(name, model, intra_op_threads=None, inter_op_threads=None):
+    """
+    Wrap the already loaded fp32 model in the requested backend. The fp32 model
+    supplies the config (id2label) and is the fallback when no export exists.
+    """
+    configure_threads(intra_op_threads, inter_op_threads)
+
+    if name == 'torch':
+        return model
+
+    if name == 'torch-int8':
+        if os.path.exists(INT8_PATH) and check_export_is_current():
+            quantized = torch.load(INT8_PATH, weights_only=False)
+        else:
+            if os.path.exists(INT8_PATH):
+                print("int8 export is older than ml_model/; quantizing in memory (re-run --export)", file=sys.stderr)
+            quantized = quantize_int8(model)
+        return quantized.eval()
+
+    if name == 'onnx':
+        if not os.path.exists(ONNX_PATH):
+            raise RuntimeError(f"No ONNX export at {ONNX_PATH}; run transformer_classifier.py --export first")
+        if not check_export_is_current():
+            raise RuntimeError("ONNX export is older than ml_model/; run transformer_classifier.py --export again")
+        return OnnxSequenceClassifier(ONNX_PATH, model.config, intra_op_threads, inter_op_threads)
+
+    raise ValueError(f"Unknown backend: {name} (expected one of {', '.join(BACKENDS)})")
+
+def export_artifacts(tokenizer, model, out_dir=ExportDir):
+    """Write the int8 module and the ONNX graph for ml_model/ into out_dir."""
+    os.makedirs(out_dir, exist_ok=True)
+    model.eval()
+
+    torch.save(quantize_int8(model), os.path.join(out_dir, os.path.basename(INT8_PATH)))
+
+    sample = tokenizer(["Question: export sample\nA: one\nB: two"], return_tensors="pt")
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['logits'] = {0: 'batch'}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            os.path.join(out_dir, os.path.basename(ONNX_PATH)),
+            input_names=input_names,
+            output_names=['logits'],
+            dynamic_axes=dynamic_axes,
+            opset_version=ONNX_OPSET
+        )
+
+    manifest = {
+        "source_fingerprint": model_fingerprint(ModelDir),
+        "onnx_opset": ONNX_OPSET,
+        "torch_version": torch.__version__
+    }
+    with open(os.path.join(out_dir, os.path.basename(MANIFEST_PATH)), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+def parity_check(questions, tokenizer, reference, candidate, predict):
+    """Compare the topic argmax of a candidate backend against the fp32 reference."""
+    expected = predict(questions, tokenizer, reference)
+    actual = predict(questions, tokenizer, candidate)
+
+    mismatches = [i for i, (a, b) in enumerate(zip(expected, actual)) if a['topic'] != b['topic']]
+    checked = len(questions)
+    return {
+        "checked": checked,
+        "matches": checked - len(mismatches),
+        "agreement": round((checked - len(mismatches)) / checked, 4) if checked else 1.0,
+        "mismatches": mismatches
+    }
@@ -0,0 +1,94 @@
+# inference_metrics.py
+# Stage timings and an opt-in sampling profiler for the classifier workers.
+#
+# TIMINGS accumulates how long model load, tokenization and the forward pass take; the
+# --serve worker reports them in its health reply. SamplingProfiler is a stdlib-only
+# wall-clock profiler: a background thread samples the main thread's stack every few
+# milliseconds and counts collapsed stacks ("a;b;c 42" per line), the input format of
+# flamegraph.pl / speedscope. It only runs when asked for (--profile or CLASSIFIER_PROFILE).
+import sys
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+class StageTimings:
+    """Count / total / max seconds per named stage; thread-safe."""
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds, items=0):
+        with self._lock:
+            entry = self._stages.setdefault(stage, {"calls": 0, "items": 0, "total": 0.0, "max": 0.0})
+            entry["calls"] += 1
+            entry["items"] += items
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+
+    @contextmanager
+    def time(self, stage, items=0):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started, items)
+
+    def snapshot(self):
+        with self._lock:
+            return {stage: {
+                "calls": entry["calls"],
+                "items": entry["items"],
+                "total_seconds": round(entry["total"], 4),
+                "mean_ms": round(entry["total"] / entry["calls"] * 1000, 3) if entry["calls"] else None,
+                "max_ms": round(entry["max"] * 1000, 3),
+            } for stage, entry in self._stages.items()}
+
+TIMINGS = StageTimings()
+
+class SamplingProfiler:
+    """Periodically sample one thread's stack and count the collapsed stacks."""
+
+    def __init__(self, output_path, interval=0.005, thread_id=None):
+        self.output_path = output_path
+        self.interval = interval
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def dump(self):
+        """Write the collapsed stacks collected so far; returns the number of samples."""
+        with open(self.output_path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return self.samples
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        return self.dump()
+
+    def status(self):
+        return {"output_path": self.output_path, "interval_ms": self.interval * 1000, "samples": self.samples}
@@ -1,8 +1,39 @@
-from flask import Flask, request, jsonify
-from mab_model import get_next_difficulty, update_bandit, reset_bandit
+import os
+import time
+import logging
+
+from flask import Flask, request, jsonify, g, Response
+from mab_model import get_next_difficulty, update_bandit, reset_bandit, get_next_difficulties, update_bandits
+from metrics import registry, REQUEST_SECONDS
+
+# WARNING by default: the per-decision DEBUG trace of mab_model stays off the hot path
+logging.basicConfig(level=os.environ.get("MAB_LOG_LEVEL", "WARNING").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
 app = Flask(__name__)
 
+# Upper bound on items per batch request
+MAX_BATCH_SIZE = 5000
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        # The route pattern, not the raw path, so labels stay bounded
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, status=str(response.status_code))
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    if request.args.get("format") == "json":
+        return jsonify(registry.snapshot())
+    return Response(registry.render_text(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/question/next", methods=["GET"])
 def next_question():
     student_id = request.args.get("student_id")
@@ -38,9 +69,76 @@ def submit_answer():
     except Exception:
         return jsonify({"error": "Invalid decision or reward"}), 400
 
-    update_bandit(student_id, decision, reward)
+    # Optional: answer with the next difficulty too, saving the follow-up GET /question/next
+    return_next = bool(data.get("return_next"))
+    next_diff = update_bandit(student_id, decision, reward, return_next=return_next)
+
+    response = {"status": "updated successfully!"}
+    if return_next:
+        # SAFETY: always return int
+        try:
+            response["next_difficulty"] = int(next_diff)
+        except Exception:
+            response["next_difficulty"] = 3
+
+    return jsonify(response)
+
+@app.route("/question/next/batch", methods=["POST"])
+def next_question_batch():
+    data = request.json or {}
+    student_ids = data.get("student_ids")
+
+    if not isinstance(student_ids, list) or not student_ids:
+        return jsonify({"error": "student_ids (non-empty list) required"}), 400
+    if len(student_ids) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"At most {MAX_BATCH_SIZE} student_ids per request"}), 400
+
+    valid_ids = [str(sid) for sid in student_ids if sid]
+    choices = get_next_difficulties(valid_ids) if valid_ids else {}
+
+    results = []
+    for sid in student_ids:
+        if not sid:
+            results.append({"student_id": sid, "error": "student_id required"})
+            continue
+        # SAFETY: always return int
+        try:
+            next_diff = int(choices[str(sid)])
+        except Exception:
+            next_diff = 3
+        results.append({"student_id": sid, "next_difficulty": next_diff})
+
+    return jsonify({"results": results})
+
+
+@app.route("/answer/batch", methods=["POST"])
+def submit_answer_batch():
+    data = request.json or {}
+    answers = data.get("answers")
+
+    if not isinstance(answers, list) or not answers:
+        return jsonify({"error": "answers (non-empty list) required"}), 400
+    if len(answers) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"At most {MAX_BATCH_SIZE} answers per request"}), 400
+
+    tuples = []
+    for item in answers:
+        item = item if isinstance(item, dict) else {}
+        sid = item.get("student_id")
+        tuples.append((str(sid) if sid else None, item.get("decision"), item.get("reward")))
+
+    results = update_bandits(tuples, return_next=bool(data.get("return_next")))
+    for item, result in zip(answers, results):
+        result["student_id"] = item.get("student_id") if isinstance(item, dict) else None
+        if "next_difficulty" in result:
+            # SAFETY: always return int
+            try:
+                result["next_difficulty"] = int(result["next_difficulty"])
+            except Exception:
+                result["next_difficulty"] = 3
+
+    return jsonify({"results": results})
 
-    return jsonify({"status": "updated successfully!"})
 
 @app.route("/reset", methods=["POST"])
 def reset_bandit_api():
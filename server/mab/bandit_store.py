@@ -0,0 +1,392 @@
+# -------------------------
+# Storage backends for per-student bandit data
+# -------------------------
+# Both backends expose the same small interface used by mab_model:
+#
+#   load(student_id)                  -> state dict, or None for an unknown student
+#   update(student_id, apply, event)  -> transactional read-modify-write; apply(state) returns
+#                                        the new state and event=(decision, reward) is appended
+#                                        to the history in the same transaction
+#   load_many(student_ids)            -> {student_id: state} for the known students
+#   update_many(updates)              -> several (student_id, apply, event) updates, in order,
+#                                        persisted together; returns the final state per student
+#   history(student_id, limit)        -> {"decisions": [...], "rewards": [...]}, newest `limit` events
+#   compact(student_id, keep)         -> drop all but the newest `keep` events from the log
+#   delete(student_id)
+#   import_student(...)               -> bulk load used by the migration tool
+import os
+import json
+import time
+import queue
+import zlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: per-student locks are then only thread-level (single-process serving)
+    fcntl = None
+
+MODEL_DIR = "bandit_models"
+DB_PATH = os.environ.get("BANDIT_DB_PATH", os.path.join(MODEL_DIR, "bandit.db"))
+DB_POOL_SIZE = int(os.environ.get("BANDIT_DB_POOL_SIZE", 8))
+LOCK_STRIPES = int(os.environ.get("BANDIT_LOCK_STRIPES", 256))
+
+# -------------------------
+# Per-student serialization
+# -------------------------
+class StripedLock:
+    """
+    Serializes work on one student across threads and, through flock'ed lock files,
+    across pre-forked worker processes. Students are hashed onto a fixed number of
+    stripes, so memory stays constant however many students there are.
+    """
+
+    def __init__(self, lock_dir, stripes=LOCK_STRIPES):
+        self.lock_dir = lock_dir
+        self.stripes = stripes
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def stripe(self, student_id):
+        return zlib.crc32(str(student_id).encode("utf-8")) % self.stripes
+
+    @contextmanager
+    def hold(self, student_id):
+        index = self.stripe(student_id)
+        with self._locks[index]:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.lock_dir, exist_ok=True)
+            with open(os.path.join(self.lock_dir, f"{index}.lock"), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+def write_json_atomic(path, data):
+    """Write to a temp file and rename over the target, so readers never see a half-written file."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def write_lines_atomic(path, lines):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        for line in lines:
+            f.write(line + "\n")
+    os.replace(tmp_path, path)
+
+# -------------------------
+# Legacy: one set of files per student
+# -------------------------
+class FileStore:
+    """
+    One set of files per student in bandit_models/: <id>_state.json (the snapshot) and
+    <id>_events.ndjson (append-only answer log, one [decision, reward] per line).
+    The older <id>_history.json is still read and is folded into the log on compaction.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, rebuild_state=None):
+        self.model_dir = model_dir
+        # Students from before the state file existed get their state rebuilt from history
+        self.rebuild_state = rebuild_state
+        # Plain files have no transactions: read-modify-write is guarded per student
+        self.locks = StripedLock(os.path.join(model_dir, ".locks"))
+
+    def model_path(self, student_id):
+        # Legacy mabwiser pickle; no longer written, only cleaned up
+        return f"{self.model_dir}/{student_id}.pkl"
+
+    def history_path(self, student_id):
+        # Legacy full-history JSON; no longer written
+        return f"{self.model_dir}/{student_id}_history.json"
+
+    def events_path(self, student_id):
+        return f"{self.model_dir}/{student_id}_events.ndjson"
+
+    def state_path(self, student_id):
+        return f"{self.model_dir}/{student_id}_state.json"
+
+    def history(self, student_id, limit=None):
+        history = {"decisions": [], "rewards": []}
+
+        legacy_path = self.history_path(student_id)
+        if os.path.exists(legacy_path):
+            with open(legacy_path, "r") as f:
+                history = json.load(f)
+
+        events_path = self.events_path(student_id)
+        if os.path.exists(events_path):
+            with open(events_path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        decision, reward = json.loads(line)
+                        history["decisions"].append(decision)
+                        history["rewards"].append(reward)
+
+        if limit:
+            history = {"decisions": history["decisions"][-limit:], "rewards": history["rewards"][-limit:]}
+        return history
+
+    def load(self, student_id):
+        path = self.state_path(student_id)
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                return json.load(f)
+        if self.rebuild_state and (os.path.exists(self.history_path(student_id))
+                                   or os.path.exists(self.events_path(student_id))):
+            return self.rebuild_state(self.history(student_id))
+        return None
+
+    def load_many(self, student_ids):
+        states = {}
+        for student_id in student_ids:
+            state = self.load(student_id)
+            if state is not None:
+                states[student_id] = state
+        return states
+
+    def update_many(self, updates):
+        return {student_id: self.update(student_id, apply, event) for student_id, apply, event in updates}
+
+    def update(self, student_id, apply, event=None):
+        os.makedirs(self.model_dir, exist_ok=True)
+        with self.locks.hold(student_id):
+            state = apply(self.load(student_id))
+
+            if event is not None:
+                # O(1): one appended line, however long the history is
+                with open(self.events_path(student_id), "a") as f:
+                    f.write(json.dumps([event[0], event[1]]) + "\n")
+
+            write_json_atomic(self.state_path(student_id), state)
+        return state
+
+    def compact(self, student_id, keep):
+        """Keep only the newest `keep` events; the state snapshot already summarises the rest."""
+        with self.locks.hold(student_id):
+            history = self.history(student_id, limit=keep)
+            write_lines_atomic(self.events_path(student_id),
+                               [json.dumps([d, r]) for d, r in zip(history["decisions"], history["rewards"])])
+            if os.path.exists(self.history_path(student_id)):
+                os.remove(self.history_path(student_id))
+
+    def delete(self, student_id):
+        with self.locks.hold(student_id):
+            for path in (self.model_path(student_id), self.history_path(student_id),
+                         self.events_path(student_id), self.state_path(student_id)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def import_student(self, student_id, state, history):
+        os.makedirs(self.model_dir, exist_ok=True)
+        write_json_atomic(self.state_path(student_id), state)
+        write_lines_atomic(self.events_path(student_id),
+                           [json.dumps([str(d), int(r)]) for d, r in zip(history["decisions"], history["rewards"])])
+
+# -------------------------
+# SQLite (WAL): one database file for every student
+# -------------------------
+class ConnectionPool:
+    """A fixed-size pool of SQLite connections shared between request threads."""
+
+    def __init__(self, path, size=DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # isolation_level=None: transactions are opened explicitly with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        if os.getpid() != self._pid:
+            # Forked worker: SQLite connections must not cross fork(), start a fresh pool
+            self._reset()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            conn = self._connect() if can_create else self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+class SQLiteStore:
+    """
+    All students in one WAL-mode SQLite database; each update is a single transaction.
+    bandit_state holds the snapshot, bandit_history is the append-only answer log.
+    """
+
+    def __init__(self, path=DB_PATH, pool_size=DB_POOL_SIZE):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.pool = ConnectionPool(path, pool_size)
+        self._local = threading.local()
+        with self.pool.connection() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS bandit_state (
+                    student_id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS bandit_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    student_id TEXT NOT NULL REFERENCES bandit_state(student_id) ON DELETE CASCADE,
+                    decision TEXT NOT NULL,
+                    reward INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_bandit_history_student ON bandit_history (student_id, id);
+            """)
+
+    @contextmanager
+    def transaction(self):
+        with self.pool.connection() as conn:
+            # IMMEDIATE takes the write lock up front, so two read-modify-writes can't interleave,
+            # whichever thread or worker process they come from
+            conn.execute("BEGIN IMMEDIATE")
+            self._local.conn = conn
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._local.conn = None
+
+    @contextmanager
+    def reader(self):
+        """A connection for reads; inside an update callback, the transaction's own one."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+        else:
+            with self.pool.connection() as conn:
+                yield conn
+
+    def load(self, student_id):
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT state FROM bandit_state WHERE student_id = ?", (student_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _select_states(self, conn, student_ids):
+        states = {}
+        ids = list(dict.fromkeys(student_ids))
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT student_id, state FROM bandit_state WHERE student_id IN ({placeholders})", chunk)
+            states.update((student_id, json.loads(state)) for student_id, state in rows)
+        return states
+
+    def load_many(self, student_ids):
+        with self.pool.connection() as conn:
+            return self._select_states(conn, student_ids)
+
+    def update_many(self, updates):
+        """Apply many updates in one transaction: one bulk read, one bulk write."""
+        with self.transaction() as conn:
+            states = self._select_states(conn, [student_id for student_id, _, _ in updates])
+            now = time.time()
+            events = []
+            for student_id, apply, event in updates:
+                states[student_id] = apply(states.get(student_id))
+                if event is not None:
+                    events.append((student_id, event[0], event[1], now))
+
+            touched = {student_id for student_id, _, _ in updates}
+            conn.executemany(
+                "INSERT INTO bandit_state (student_id, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(student_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                [(student_id, json.dumps(states[student_id]), now) for student_id in touched])
+            conn.executemany(
+                "INSERT INTO bandit_history (student_id, decision, reward, created_at) VALUES (?, ?, ?, ?)",
+                events)
+        return {student_id: states[student_id] for student_id in touched}
+
+    def history(self, student_id, limit=None):
+        with self.reader() as conn:
+            if limit:
+                rows = conn.execute(
+                    "SELECT decision, reward FROM (SELECT id, decision, reward FROM bandit_history "
+                    "WHERE student_id = ? ORDER BY id DESC LIMIT ?) ORDER BY id",
+                    (student_id, limit)).fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT decision, reward FROM bandit_history WHERE student_id = ? ORDER BY id",
+                    (student_id,)).fetchall()
+        return {"decisions": [d for d, _ in rows], "rewards": [r for _, r in rows]}
+
+    def compact(self, student_id, keep):
+        """Keep only the newest `keep` events; the state row already summarises the rest."""
+        with self.transaction() as conn:
+            conn.execute(
+                "DELETE FROM bandit_history WHERE student_id = ? AND id NOT IN "
+                "(SELECT id FROM bandit_history WHERE student_id = ? ORDER BY id DESC LIMIT ?)",
+                (student_id, student_id, keep))
+
+    def update(self, student_id, apply, event=None):
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT state FROM bandit_state WHERE student_id = ?", (student_id,)).fetchone()
+            state = apply(json.loads(row[0]) if row else None)
+
+            now = time.time()
+            conn.execute(
+                "INSERT INTO bandit_state (student_id, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(student_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (student_id, json.dumps(state), now))
+            if event is not None:
+                conn.execute(
+                    "INSERT INTO bandit_history (student_id, decision, reward, created_at) VALUES (?, ?, ?, ?)",
+                    (student_id, event[0], event[1], now))
+        return state
+
+    def delete(self, student_id):
+        # History rows go with it through ON DELETE CASCADE
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM bandit_state WHERE student_id = ?", (student_id,))
+
+    def import_student(self, student_id, state, history):
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM bandit_state WHERE student_id = ?", (student_id,))
+            conn.execute(
+                "INSERT INTO bandit_state (student_id, state, updated_at) VALUES (?, ?, ?)",
+                (student_id, json.dumps(state), now))
+            conn.executemany(
+                "INSERT INTO bandit_history (student_id, decision, reward, created_at) VALUES (?, ?, ?, ?)",
+                [(student_id, str(d), int(r), now) for d, r in zip(history["decisions"], history["rewards"])])
+
+def get_store(backend=None, rebuild_state=None):
+    """Pick the storage backend from BANDIT_STORE ('sqlite' by default, or 'file')."""
+    backend = backend or os.environ.get("BANDIT_STORE", "sqlite")
+    if backend == "sqlite":
+        return SQLiteStore()
+    if backend == "file":
+        return FileStore(rebuild_state=rebuild_state)
+    raise ValueError(f"Unknown BANDIT_STORE: {backend}")
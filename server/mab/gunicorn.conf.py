@@ -0,0 +1,26 @@
+# Production serving for the bandit service: pre-forked workers, each with a few threads.
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Updates stay correct across workers because every answer is a locked read-modify-write:
+# a BEGIN IMMEDIATE transaction with the SQLite store, striped flock'ed locks with the
+# file store. The in-process state cache can't see other workers' writes, so it is
+# disabled here unless BANDIT_STATE_CACHE_SIZE is set explicitly.
+import os
+import multiprocessing
+
+# Workers share bandit_models/ relative to this directory, like `python app.py`
+chdir = os.path.dirname(os.path.abspath(__file__))
+
+bind = os.environ.get("MAB_BIND", "127.0.0.1:5000")
+workers = int(os.environ.get("MAB_WORKERS", multiprocessing.cpu_count()))
+threads = int(os.environ.get("MAB_THREADS", 4))
+worker_class = "gthread"
+
+# Each worker opens its own SQLite connections after fork
+preload_app = False
+
+timeout = 30
+keepalive = 5
+
+raw_env = [f"BANDIT_STATE_CACHE_SIZE={os.environ.get('BANDIT_STATE_CACHE_SIZE', '0')}"]
@@ -1,163 +1,408 @@
-from mabwiser.mab import MAB, LearningPolicy
 import os
-import pickle
-import json
-import numpy as np
-from collections import Counter, defaultdict
+import logging
+import threading
+from collections import OrderedDict, Counter
 import random
 
+from bandit_store import get_store
+from metrics import STORE_SECONDS, STATE_CACHE, ARM_SELECTIONS, ANSWERS
+
+# Debug tracing of every decision; enable with MAB_LOG_LEVEL=DEBUG (see app.py)
+log = logging.getLogger("mab")
+
 # -------------------------
 # Arms (difficulty levels)
 # -------------------------
 arms = ['1', '2', '3', '4', '5']
-MODEL_DIR = "bandit_models"
 
 MIN_EXPLORATION = 3
 EXPLOIT_PROB = 0.7
 MIN_SAMPLES_FOR_EXPLOIT = 3
 
-# -------------------------
-# Paths
-# -------------------------
-def get_model_path(student_id):
-    return f"{MODEL_DIR}/{student_id}.pkl"
+# Selection policy: beta_mean (default), epsilon_greedy or thompson
+POLICY = os.environ.get("BANDIT_POLICY", "beta_mean")
+EPSILON = float(os.environ.get("BANDIT_EPSILON", 0.1))
 
-def get_history_path(student_id):
-    return f"{MODEL_DIR}/{student_id}_history.json"
+# Store the next arm with the state on every update, so GET /question/next can serve it as-is
+PRECOMPUTE_NEXT = os.environ.get("BANDIT_PRECOMPUTE_NEXT", "0") == "1"
 
-# -------------------------
-# History
-# -------------------------
-def load_history(student_id):
-    os.makedirs(MODEL_DIR, exist_ok=True)
-    path = get_history_path(student_id)
+# Per-arm statistics view. Cumulative by default; BANDIT_WINDOW=N counts only the last N
+# answers, BANDIT_DECAY=g (0 < g < 1) down-weights every older answer by g per new answer.
+WINDOW_SIZE = int(os.environ.get("BANDIT_WINDOW", 0))
+DECAY = float(os.environ.get("BANDIT_DECAY", 1.0))
+if WINDOW_SIZE:
+    STATS_MODE = f"window:{WINDOW_SIZE}"
+elif DECAY < 1:
+    STATS_MODE = f"decay:{DECAY}"
+else:
+    STATS_MODE = "cumulative"
+
+if WINDOW_SIZE < 0 or not 0 < DECAY <= 1:
+    raise ValueError(f"Invalid BANDIT_WINDOW/BANDIT_DECAY: {WINDOW_SIZE}/{DECAY} (expected N >= 0, 0 < g <= 1)")
 
-    if os.path.exists(path):
-        with open(path, "r") as f:
-            return json.load(f)
+# Answer log retention: every COMPACT_EVERY answers the log is cut back to the newest
+# HISTORY_LIMIT events (0 keeps everything). The state snapshot summarises the rest.
+HISTORY_LIMIT = int(os.environ.get("BANDIT_HISTORY_LIMIT", 1000))
+COMPACT_EVERY = int(os.environ.get("BANDIT_COMPACT_EVERY", 100))
 
-    return {"decisions": [], "rewards": []}
+# Hot student states kept in memory in front of disk. The cache is only coherent while
+# this process is the sole writer: multi-process serving (gunicorn.conf.py) sets it to 0.
+STATE_CACHE_SIZE = int(os.environ.get("BANDIT_STATE_CACHE_SIZE", 10000))
 
 # -------------------------
-# Model
+# State (per-arm sufficient statistics)
 # -------------------------
-def load_model(student_id):
-    os.makedirs(MODEL_DIR, exist_ok=True)
-    path = get_model_path(student_id)
+# Everything the selection rule needs is, per arm, how often it was played and how
+# many of those plays were rewarded. Keeping just those counts makes choosing the
+# next difficulty O(1) no matter how long the student has been practising.
+_state_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def new_state():
+    return {
+        "counts": {arm: 0 for arm in arms},
+        "rewards": {arm: 0 for arm in arms},
+        # Undecayed, unwindowed plays per arm: the exploration gates of beta_mean count real
+        # samples, which a window or decay would keep below MIN_EXPLORATION indefinitely
+        "plays": {arm: 0 for arm in arms},
+        "mode": STATS_MODE
+    }
+
+def record_answer(state, decision, reward):
+    """O(1) update of the per-arm statistics under the configured STATS_MODE."""
+    counts = state["counts"]
+    rewards = state["rewards"]
+    if decision not in counts:
+        return state
+    # States saved before plays were tracked start from their counts
+    plays = state.setdefault("plays", dict(counts))
+    plays[decision] += 1
+
+    if WINDOW_SIZE:
+        window = state.setdefault("window", [])
+        window.append([decision, reward])
+        if len(window) > WINDOW_SIZE:
+            old_decision, old_reward = window.pop(0)
+            counts[old_decision] -= 1
+            rewards[old_decision] -= old_reward
+    elif DECAY < 1:
+        for arm in arms:
+            counts[arm] *= DECAY
+            rewards[arm] *= DECAY
+
+    counts[decision] += 1
+    rewards[decision] += reward
+    return state
+
+def state_from_history(history):
+    """Rebuild the statistics by replaying a history (students from before the state file, or a mode change)."""
+    state = new_state()
+    for d, r in zip(history["decisions"], history["rewards"]):
+        record_answer(state, str(d), int(r))
+    return state
 
-    if os.path.exists(path):
-        with open(path, "rb") as f:
-            return pickle.load(f)
+# -------------------------
+# Storage (BANDIT_STORE=sqlite|file, see bandit_store.py)
+# -------------------------
+# Opened on first use, so importing this module (e.g. for state_from_history in
+# migrate_bandit_models.py) doesn't create the default database
+_store = None
+_store_lock = threading.Lock()
+
+def get_bandit_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = get_store(rebuild_state=state_from_history)
+    return _store
+
+def cache_state(student_id, state):
+    with _cache_lock:
+        cached = _state_cache.get(student_id)
+        # Concurrent updates can finish out of order; never replace a newer state with an older one
+        if cached is not None and cached.get("version", 0) > state.get("version", 0):
+            return
+        _state_cache[student_id] = state
+        _state_cache.move_to_end(student_id)
+        while len(_state_cache) > STATE_CACHE_SIZE:
+            _state_cache.popitem(last=False)
+
+def cached_state(student_id):
+    if not STATE_CACHE_SIZE:
+        return None
+    with _cache_lock:
+        state = _state_cache.get(student_id)
+        if state is not None:
+            _state_cache.move_to_end(student_id)
+    STATE_CACHE.inc(result="hit" if state is not None else "miss")
+    return state
+
+def load_state(student_id):
+    state = cached_state(student_id)
+    if state is not None:
+        return state
+
+    with STORE_SECONDS.time(op="load"):
+        state = get_bandit_store().load(student_id)
+    state = state or new_state()
+    cache_state(student_id, state)
+    return state
+
+def load_states(student_ids):
+    """Bulk version of load_state: cached states plus one store read for the rest."""
+    states = {}
+    missing = []
+    for student_id in student_ids:
+        state = cached_state(student_id)
+        if state is not None:
+            states[student_id] = state
+        else:
+            missing.append(student_id)
 
-    return MAB(
-        arms,
-        learning_policy=LearningPolicy.EpsilonGreedy(epsilon=0.1)
-    )
+    if missing:
+        with STORE_SECONDS.time(op="load_many"):
+            loaded = get_bandit_store().load_many(missing)
+        for student_id in missing:
+            state = loaded.get(student_id) or new_state()
+            cache_state(student_id, state)
+            states[student_id] = state
+    return states
 
-def save_model(bandit, student_id):
-    with open(get_model_path(student_id), "wb") as f:
-        pickle.dump(bandit, f)
+def load_history(student_id):
+    with STORE_SECONDS.time(op="history"):
+        return get_bandit_store().history(student_id)
 
 # -------------------------
-# Predict next difficulty
+# Policies
 # -------------------------
-def get_next_difficulty(student_id):
-    history = load_history(student_id)
-
-    decisions = np.array(history["decisions"], dtype=str)
-    rewards = np.array(history["rewards"], dtype=int)
-
-    arm_counts = Counter(decisions)
-    print(f"\n[DEBUG] Student {student_id} arm counts → {arm_counts}")
+# Each policy picks an arm from the per-arm counts/reward sums alone.
+def beta_mean_policy(state):
+    arm_counts = state["counts"]
+    arm_rewards = state["rewards"]
+    arm_plays = state.get("plays", arm_counts)
 
     # 1️⃣ Initial Exploration
-    under_sampled = [arm for arm in arms if arm_counts.get(arm, 0) < MIN_EXPLORATION]
-    print(f"[DEBUG] Under-sampled arms → {under_sampled}")
+    under_sampled = [arm for arm in arms if arm_plays.get(arm, 0) < MIN_EXPLORATION]
+    log.debug("[DEBUG] Under-sampled arms → %s", under_sampled)
 
     if under_sampled:
         chosen = random.choice(under_sampled)
-        print(f"[EXPLORE - INITIAL] Choosing under-sampled difficulty → {chosen}")
+        log.debug("[EXPLORE - INITIAL] Choosing under-sampled difficulty → %s", chosen)
         return chosen
 
     # 2️⃣ Bayesian Mean Calculation
-    rewards_per_arm = defaultdict(list)
-    for d, r in zip(decisions, rewards):
-        rewards_per_arm[d].append(r)
-
     best_arms = []
     best_mean = -1
 
-    print("\n[DEBUG] Beta Mean per arm:")
+    # The per-arm trace is only formatted when someone is reading it
+    trace = log.isEnabledFor(logging.DEBUG)
+    if trace:
+        log.debug("[DEBUG] Beta Mean per arm:")
     for arm in arms:
-        samples = rewards_per_arm[arm]
-        if len(samples) >= MIN_SAMPLES_FOR_EXPLOIT:
-            a = sum(samples) + 1
-            b = len(samples) - sum(samples) + 1
+        n = arm_counts.get(arm, 0)
+        successes = arm_rewards.get(arm, 0)
+        if arm_plays.get(arm, 0) >= MIN_SAMPLES_FOR_EXPLOIT:
+            a = successes + 1
+            b = n - successes + 1
             mean = a / (a + b)
 
-            print(f"  Arm {arm} → samples={len(samples)}, mean={mean:.3f}")
+            if trace:
+                log.debug("  Arm %s → samples=%s, mean=%.3f", arm, n, mean)
 
             if mean > best_mean:
                 best_mean = mean
                 best_arms = [arm]
             elif mean == best_mean:
                 best_arms.append(arm)
-        else:
-            print(f"  Arm {arm} → insufficient samples ({len(samples)})")
+        elif trace:
+            log.debug("  Arm %s → insufficient samples (%s)", arm, n)
 
     if not best_arms:
         chosen = random.choice(arms)
-        print(f"[FALLBACK] No confident arm → random choice {chosen}")
+        log.debug("[FALLBACK] No confident arm → random choice %s", chosen)
         return chosen
 
-    print(f"[DEBUG] Best arms → {best_arms} (mean={best_mean:.3f})")
+    log.debug("[DEBUG] Best arms → %s (mean=%.3f)", best_arms, best_mean)
 
     # 3️⃣ Exploit vs Explore
     if random.random() < EXPLOIT_PROB:
         chosen = max(best_arms, key=int)
-        print(f"[EXPLOIT] Choosing best difficulty → {chosen}")
+        log.debug("[EXPLOIT] Choosing best difficulty → %s", chosen)
         return chosen
 
     explore_arms = [arm for arm in arms if arm not in best_arms]
     chosen = random.choice(explore_arms) if explore_arms else random.choice(arms)
-    print(f"[EXPLORE] Exploring non-best difficulty → {chosen}")
+    log.debug("[EXPLORE] Exploring non-best difficulty → %s", chosen)
+    return chosen
+
+def epsilon_greedy_policy(state):
+    arm_counts = state["counts"]
+    arm_rewards = state["rewards"]
+
+    untried = [arm for arm in arms if arm_counts.get(arm, 0) == 0]
+    if untried or random.random() < EPSILON:
+        chosen = random.choice(untried or arms)
+        log.debug("[EXPLORE - EPSILON] Choosing difficulty → %s", chosen)
+        return chosen
+
+    means = {arm: arm_rewards.get(arm, 0) / arm_counts[arm] for arm in arms}
+    best_mean = max(means.values())
+    chosen = max([arm for arm in arms if means[arm] == best_mean], key=int)
+    log.debug("[EXPLOIT - EPSILON] Choosing best difficulty → %s (mean=%.3f)", chosen, best_mean)
+    return chosen
+
+def thompson_policy(state):
+    arm_counts = state["counts"]
+    arm_rewards = state["rewards"]
+
+    # One draw per arm from its Beta(successes + 1, failures + 1) posterior
+    samples = {}
+    for arm in arms:
+        n = arm_counts.get(arm, 0)
+        successes = arm_rewards.get(arm, 0)
+        samples[arm] = random.betavariate(successes + 1, n - successes + 1)
+
+    chosen = max(arms, key=lambda arm: samples[arm])
+    log.debug("[THOMPSON] Choosing difficulty → %s (sample=%.3f)", chosen, samples[chosen])
     return chosen
 
+POLICIES = {
+    "beta_mean": beta_mean_policy,
+    "epsilon_greedy": epsilon_greedy_policy,
+    "thompson": thompson_policy
+}
+
+if POLICY not in POLICIES:
+    raise ValueError(f"Unknown BANDIT_POLICY: {POLICY} (expected one of {', '.join(POLICIES)})")
+
 # -------------------------
-# Update bandit (per student)
+# Predict next difficulty
 # -------------------------
-def update_bandit(student_id, decision, reward):
-    if decision is None or reward is None:
-        print("[WARN] Invalid bandit update skipped")
-        return
+def get_next_difficulty(student_id, policy=None):
+    state = load_state(student_id)
+    log.debug("[DEBUG] Student %s arm counts → %s", student_id, state["counts"])
 
-    decision = str(decision)
-    reward = int(reward)
+    if PRECOMPUTE_NEXT and policy is None and state.get("next_arm"):
+        log.debug("[PRECOMPUTED] Serving stored difficulty → %s", state["next_arm"])
+        ARM_SELECTIONS.inc(policy=POLICY, arm=state["next_arm"], source="precomputed")
+        return state["next_arm"]
 
-    print(f"[MAB UPDATE] decision={decision}, reward={reward}")
+    chosen = POLICIES[policy or POLICY](state)
+    ARM_SELECTIONS.inc(policy=policy or POLICY, arm=chosen, source="computed")
+    return chosen
 
-    bandit = load_model(student_id)
-    bandit.partial_fit(
-        np.array([decision]),
-        np.array([reward])
-    )
-    save_model(bandit, student_id)
+def get_next_difficulties(student_ids, policy=None):
+    """Next difficulty for many students, loading all their states in bulk."""
+    states = load_states(student_ids)
+    choose = POLICIES[policy or POLICY]
+    choices = {student_id: choose(states[student_id]) for student_id in student_ids}
+    for chosen, n in Counter(choices.values()).items():
+        ARM_SELECTIONS.inc(n, policy=policy or POLICY, arm=chosen, source="computed")
+    return choices
 
-    history = load_history(student_id)
-    history["decisions"].append(decision)
-    history["rewards"].append(reward)
+# -------------------------
+# Update bandit (per student)
+# -------------------------
+def update_bandit(student_id, decision, reward, return_next=False):
+    """
+    Record one answer. With return_next (or BANDIT_PRECOMPUTE_NEXT) the next difficulty is
+    chosen from the state just updated, inside the same load/save, and returned.
+    """
+    if decision is None or reward is None:
+        log.warning("[WARN] Invalid bandit update skipped")
+        return None
 
-    with open(get_history_path(student_id), "w") as f:
-        json.dump(history, f)
+    decision = str(decision)
+    reward = int(reward)
 
-    print("[MAB UPDATE] History updated successfully")
+    log.debug("[MAB UPDATE] decision=%s, reward=%s", decision, reward)
+
+    # One transaction: state and the history entry are written together
+    with STORE_SECONDS.time(op="update"):
+        state = get_bandit_store().update(student_id, apply_answer(student_id, decision, reward, return_next),
+                             event=(decision, reward))
+    cache_state(student_id, state)
+    compact_if_due(student_id, state)
+    ANSWERS.inc(arm=decision, reward=str(reward))
+
+    log.debug("[MAB UPDATE] History updated successfully")
+    return state.get("next_arm") if return_next else None
+
+def apply_answer(student_id, decision, reward, choose_next=False):
+    """Build the store callback for one answer: an incremental O(1) update of the per-arm statistics."""
+    def apply(state):
+        state = state or new_state()
+        if state.get("mode", "cumulative") != STATS_MODE:
+            # Window/decay settings changed: replay the retained log under the new ones
+            version = state.get("version", 0)
+            state = state_from_history(get_bandit_store().history(student_id, limit=max(HISTORY_LIMIT, WINDOW_SIZE)))
+            state["version"] = version
+
+        state["version"] = state.get("version", 0) + 1
+        record_answer(state, decision, reward)
+
+        if choose_next or PRECOMPUTE_NEXT:
+            state["next_arm"] = POLICIES[POLICY](state)
+        else:
+            # A stored arm would be stale once the counts have moved
+            state.pop("next_arm", None)
+        return state
+    return apply
+
+def compact_if_due(student_id, state, answered=1):
+    """Bound the answer log: periodically drop events older than the retention limit."""
+    if not HISTORY_LIMIT or not COMPACT_EVERY:
+        return
+    # A batch can move the version by several answers; compact when a multiple was crossed
+    if state.get("version", 0) % COMPACT_EVERY < answered:
+        with STORE_SECONDS.time(op="compact"):
+            get_bandit_store().compact(student_id, max(HISTORY_LIMIT, WINDOW_SIZE))
+
+def update_bandits(answers, return_next=False):
+    """
+    Apply many (student_id, decision, reward) answers in one store transaction.
+    Returns one result per answer, in order: {"status": "updated"} or {"error": ...};
+    with return_next each result also carries the student's next difficulty.
+    """
+    results = []
+    updates = []
+    for student_id, decision, reward in answers:
+        if not student_id or decision is None or reward is None:
+            results.append({"error": "student_id, decision and reward required"})
+            continue
+        try:
+            decision = str(int(decision))
+            reward = int(reward)
+        except (TypeError, ValueError):
+            results.append({"error": "Invalid decision or reward"})
+            continue
+
+        updates.append((student_id, apply_answer(student_id, decision, reward, return_next), (decision, reward)))
+        results.append({"status": "updated", "student_id": student_id})
+
+    if updates:
+        with STORE_SECONDS.time(op="update_many"):
+            states = get_bandit_store().update_many(updates)
+        answered = Counter(student_id for student_id, _, _ in updates)
+        for student_id, state in states.items():
+            cache_state(student_id, state)
+            compact_if_due(student_id, state, answered[student_id])
+        for (decision, reward), n in Counter(event for _, _, event in updates).items():
+            ANSWERS.inc(n, arm=decision, reward=str(reward))
+        log.debug("[MAB UPDATE] Batch of %s answers applied", len(updates))
+
+        if return_next:
+            # The final state of each student decides, even if they answered several times in the batch
+            for result in results:
+                if "status" in result:
+                    result["next_difficulty"] = states[result["student_id"]].get("next_arm")
+
+    for result in results:
+        result.pop("student_id", None)
+    return results
 
 def reset_bandit(student_id):
-    pkl_path = os.path.join(MODEL_DIR, f"{student_id}.pkl")
-    json_path = os.path.join(MODEL_DIR, f"{student_id}.json")
-
-    if os.path.exists(pkl_path):
-        os.remove(pkl_path)
-
-    if os.path.exists(json_path):
-        os.remove(json_path)
+    get_bandit_store().delete(student_id)
+    with _cache_lock:
+        _state_cache.pop(student_id, None)
@@ -0,0 +1,128 @@
+# -------------------------
+# In-process metrics for the bandit service
+# -------------------------
+# A small thread-safe registry of counters and latency histograms, rendered in the
+# Prometheus text format by GET /metrics (or as JSON with ?format=json). Stdlib only.
+#
+# Every gunicorn worker keeps its own registry, so a scrape reports the worker that
+# answered it; each sample carries a pid label to tell them apart.
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+# Upper bounds in seconds; the store and policy work is sub-millisecond when healthy
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.type = "counter"
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, dict(key), value) for key, value in self._values.items()]
+
+    def snapshot(self):
+        with self._lock:
+            return [{"labels": dict(key), "value": value} for key, value in self._values.items()]
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.type = "histogram"
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, series in self._series.items():
+                labels = dict(key)
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    samples.append((self.name + "_bucket", {**labels, "le": str(bound)}, cumulative))
+                samples.append((self.name + "_bucket", {**labels, "le": "+Inf"}, series["count"]))
+                samples.append((self.name + "_sum", labels, series["sum"]))
+                samples.append((self.name + "_count", labels, series["count"]))
+        return samples
+
+    def snapshot(self):
+        with self._lock:
+            return [{
+                "labels": dict(key),
+                "count": series["count"],
+                "sum_seconds": round(series["sum"], 6),
+                "mean_ms": round(series["sum"] / series["count"] * 1000, 4) if series["count"] else None,
+                "buckets": dict(zip((str(b) for b in self.buckets), series["counts"])),
+            } for key, series in self._series.items()]
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help_text):
+        metric = Counter(name, help_text)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render_text(self):
+        """Prometheus text exposition format."""
+        pid = str(os.getpid())
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                labels = {**labels, "pid": pid}
+                label_text = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+                lines.append(f"{name}{{{label_text}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        return {"pid": os.getpid(), "metrics": {metric.name: metric.snapshot() for metric in self.metrics}}
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram("mab_request_seconds", "Request latency per route.")
+STORE_SECONDS = registry.histogram("mab_store_seconds", "Bandit store call latency per operation.")
+STATE_CACHE = registry.counter("mab_state_cache_total", "In-process state cache lookups by result.")
+ARM_SELECTIONS = registry.counter("mab_arm_selections_total", "Chosen difficulty per policy.")
+ANSWERS = registry.counter("mab_answers_total", "Recorded answers per difficulty and reward.")
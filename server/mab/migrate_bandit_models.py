@@ -0,0 +1,58 @@
+# -------------------------
+# Import bandit_models/ files into the SQLite store
+# -------------------------
+# Reads every student's <id>_state.json and answer log (<id>_events.ndjson and/or the
+# older <id>_history.json) from the legacy per-student layout and writes them into the
+# single WAL database used by BANDIT_STORE=sqlite. Leftover mabwiser <id>.pkl files carry
+# nothing the store needs. Safe to re-run: each student is replaced in one transaction.
+#
+#   python migrate_bandit_models.py [--model-dir bandit_models] [--db bandit_models/bandit.db] [--remove-files]
+import os
+import argparse
+
+from bandit_store import FileStore, SQLiteStore, MODEL_DIR, DB_PATH
+from mab_model import state_from_history
+
+def find_students(model_dir):
+    students = set()
+    for name in os.listdir(model_dir):
+        if name.endswith("_history.json"):
+            students.add(name[:-len("_history.json")])
+        elif name.endswith("_events.ndjson"):
+            students.add(name[:-len("_events.ndjson")])
+        elif name.endswith("_state.json"):
+            students.add(name[:-len("_state.json")])
+        elif name.endswith(".pkl"):
+            students.add(name[:-len(".pkl")])
+    return sorted(students)
+
+def migrate(model_dir=MODEL_DIR, db_path=DB_PATH, remove_files=False):
+    source = FileStore(model_dir, rebuild_state=state_from_history)
+    target = SQLiteStore(db_path)
+
+    migrated = 0
+    for student_id in find_students(model_dir):
+        history = source.history(student_id)
+        state = source.load(student_id) or state_from_history(history)
+
+        target.import_student(student_id, state, history)
+        migrated += 1
+
+        if remove_files:
+            source.delete(student_id)
+
+        if migrated % 1000 == 0:
+            print(f"[MIGRATE] {migrated} students imported")
+
+    print(f"[MIGRATE] Done: {migrated} students imported into {db_path}")
+    return migrated
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import per-student bandit files into the SQLite store.")
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--remove-files", action="store_true",
+                        help="Delete each student's files once they are imported.")
+    args = parser.parse_args()
+
+    migrate(args.model_dir, args.db, args.remove_files)
@@ -0,0 +1,129 @@
+# -------------------------
+# Vectorized bandit engine for a whole population of students
+# -------------------------
+# The same selection rules as mab_model.py, but with the per-arm statistics of N students
+# held as (N, arms) arrays, so one call chooses the next difficulty for every student at
+# once. Used offline by simulate_bandits.py to compare policies and tune their parameters;
+# the online service keeps using mab_model.py.
+import numpy as np
+
+# Arm i is difficulty level i + 1 ('1'..'5' in mab_model)
+N_ARMS = 5
+
+# Defaults match mab_model.py
+DEFAULT_PARAMS = {
+    "min_exploration": 3,
+    "exploit_prob": 0.7,
+    "min_samples_for_exploit": 3,
+    "epsilon": 0.1,
+}
+
+def random_true_index(mask, rng):
+    """Per row, a uniformly random column among the True entries (-1 where the row has none)."""
+    keys = np.where(mask, rng.random(mask.shape), -1.0)
+    chosen = keys.argmax(axis=1)
+    chosen[~mask.any(axis=1)] = -1
+    return chosen
+
+def last_true_index(mask):
+    """Per row, the highest True column, i.e. the hardest of tied arms (max(..., key=int))."""
+    return mask.shape[1] - 1 - mask[:, ::-1].argmax(axis=1)
+
+def beta_mean_choose(counts, rewards, rng, min_exploration, exploit_prob, min_samples_for_exploit,
+                     plays=None, **_):
+    n_students = counts.shape[0]
+    chosen = np.empty(n_students, dtype=np.int64)
+    # The sample-size gates use undecayed play counts (see mab_model.py)
+    plays = counts if plays is None else plays
+
+    # 1. Initial exploration: a random under-sampled arm
+    under_sampled = plays < min_exploration
+    exploring = under_sampled.any(axis=1)
+    chosen[exploring] = random_true_index(under_sampled[exploring], rng)
+
+    # 2. Posterior mean of every arm with enough samples
+    rest = ~exploring
+    n = counts[rest]
+    eligible = plays[rest] >= min_samples_for_exploit
+    means = np.where(eligible, (rewards[rest] + 1) / (n + 2), -1.0)
+    best = eligible & (means == means.max(axis=1, keepdims=True))
+
+    # 3. Exploit (hardest best arm) or explore a non-best arm; no confident arm -> any arm
+    exploit = rng.random(len(n)) < exploit_prob
+    explore_pool = np.where((~best).any(axis=1, keepdims=True), ~best, True)
+    pick = np.where(exploit, last_true_index(best), random_true_index(explore_pool, rng))
+    no_confident = ~eligible.any(axis=1)
+    pick[no_confident] = rng.integers(0, N_ARMS, no_confident.sum())
+    chosen[rest] = pick
+    return chosen
+
+def epsilon_greedy_choose(counts, rewards, rng, epsilon, **_):
+    untried = counts == 0
+    has_untried = untried.any(axis=1)
+    explore = has_untried | (rng.random(counts.shape[0]) < epsilon)
+
+    means = rewards / np.maximum(counts, 1e-12)
+    best = means == means.max(axis=1, keepdims=True)
+    explore_pool = np.where(has_untried[:, None], untried, True)
+    return np.where(explore, random_true_index(explore_pool, rng), last_true_index(best))
+
+def thompson_choose(counts, rewards, rng, **_):
+    # One draw per arm from its Beta(successes + 1, failures + 1) posterior
+    samples = rng.beta(rewards + 1, counts - rewards + 1)
+    return samples.argmax(axis=1)
+
+POLICIES = {
+    "beta_mean": beta_mean_choose,
+    "epsilon_greedy": epsilon_greedy_choose,
+    "thompson": thompson_choose
+}
+
+class PopulationBandit:
+    """Per-arm counts and reward sums for n_students, updated and queried in bulk."""
+
+    def __init__(self, n_students, policy="beta_mean", decay=1.0, seed=None, **params):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy: {policy} (expected one of {', '.join(POLICIES)})")
+        self.policy = policy
+        self.params = {**DEFAULT_PARAMS, **params}
+        self.decay = decay
+        self.rng = np.random.default_rng(seed)
+        self.counts = np.zeros((n_students, N_ARMS))
+        self.rewards = np.zeros((n_students, N_ARMS))
+        # Undecayed per-arm plays, for beta_mean's sample-size gates
+        self.plays = np.zeros((n_students, N_ARMS))
+
+    def choose(self, students=None):
+        """Arm index (0-based) for every student, or for the given student indices."""
+        if students is None:
+            counts, rewards, plays = self.counts, self.rewards, self.plays
+        else:
+            counts, rewards, plays = self.counts[students], self.rewards[students], self.plays[students]
+        return POLICIES[self.policy](counts, rewards, self.rng, plays=plays, **self.params)
+
+    def update(self, students, arms, rewards):
+        """Record one answer per listed student (repeated students are all counted)."""
+        if self.decay < 1:
+            self.counts[students] *= self.decay
+            self.rewards[students] *= self.decay
+        np.add.at(self.counts, (students, arms), 1)
+        np.add.at(self.plays, (students, arms), 1)
+        np.add.at(self.rewards, (students, arms), rewards)
+
+    def update_all(self, arms, rewards):
+        """Record one answer for every student, in student order; faster than update()."""
+        rows = np.arange(self.counts.shape[0])
+        if self.decay < 1:
+            self.counts *= self.decay
+            self.rewards *= self.decay
+        self.counts[rows, arms] += 1
+        self.plays[rows, arms] += 1
+        self.rewards[rows, arms] += rewards
+
+    def load_states(self, states):
+        """Fill rows from mab_model-style states ({"counts": {"1": n, ...}, "rewards": {...}})."""
+        for i, state in enumerate(states):
+            for arm in range(N_ARMS):
+                self.counts[i, arm] = state["counts"].get(str(arm + 1), 0)
+                self.rewards[i, arm] = state["rewards"].get(str(arm + 1), 0)
+                self.plays[i, arm] = state.get("plays", state["counts"]).get(str(arm + 1), 0)
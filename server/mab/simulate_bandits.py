@@ -0,0 +1,171 @@
+# -------------------------
+# Offline bandit simulator
+# -------------------------
+# Runs every policy against the same simulated learners and reports regret, so policies
+# and the MIN_EXPLORATION / EXPLOIT_PROB / MIN_SAMPLES_FOR_EXPLOIT settings of
+# mab_model.py can be compared before changing the live service.
+#
+# Learners answer a question of difficulty level k correctly with probability p[k]. They
+# are either synthetic (1PL / Rasch model: ability ~ N(0, 1), level difficulties spread over
+# [-2, 2], optional drift as students improve) or fitted from logged answers in
+# data/studentAssessments.json (per-student, per-level success rate with a Beta(1, 1) prior,
+# students resampled up to --students). The reward is correctness, as in the service;
+# regret per answer is max_k p[k] - p[chosen].
+#
+#   python simulate_bandits.py --students 100000 --steps 60
+#   python simulate_bandits.py --replay ../data/studentAssessments.json --policies beta_mean
+#   python simulate_bandits.py --exploit-prob 0.5,0.7,0.9 --min-exploration 2,3,5
+import os
+import json
+import time
+import argparse
+import itertools
+
+import numpy as np
+
+from population_bandit import PopulationBandit, POLICIES, DEFAULT_PARAMS, N_ARMS
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "studentAssessments.json")
+LEVEL_DIFFICULTIES = np.linspace(-2, 2, N_ARMS)
+
+def synthetic_learners(n_students, rng):
+    """Abilities of n_students learners; success probabilities follow from ability - difficulty."""
+    return rng.normal(0, 1, n_students)
+
+def success_probabilities(abilities):
+    return 1 / (1 + np.exp(-(abilities[:, None] - LEVEL_DIFFICULTIES[None, :])))
+
+def replay_learners(path, n_students, rng):
+    """Per-level success probabilities fitted from logged answers, resampled to n_students."""
+    with open(path, "r") as f:
+        attempts = json.load(f)
+
+    tallies = {}
+    for attempt in attempts:
+        student = tallies.setdefault(attempt.get("studentId") or attempt.get("student_id"),
+                                     np.zeros((2, N_ARMS)))
+        for answer in attempt.get("answers") or []:
+            try:
+                level = int(answer.get("difficulty")) - 1
+            except (TypeError, ValueError):
+                continue
+            if 0 <= level < N_ARMS:
+                correct = answer.get("correct", answer.get("isCorrect"))
+                student[0, level] += 1
+                student[1, level] += bool(correct)
+
+    answered = [t for t in tallies.values() if t[0].sum() > 0]
+    if not answered:
+        raise ValueError(f"No answers with a difficulty level in {path}")
+
+    fitted = np.array([(t[1] + 1) / (t[0] + 2) for t in answered])
+    return fitted[rng.integers(0, len(fitted), n_students)]
+
+def simulate(probabilities, steps, policy, seed, drift=0.0, decay=1.0, **params):
+    """Run one policy for `steps` answers per student; every student answers once per step."""
+    rng = np.random.default_rng(seed)
+    n_students = probabilities.shape[0]
+    bandit = PopulationBandit(n_students, policy=policy, decay=decay, seed=seed, **params)
+    rows = np.arange(n_students)
+
+    regret = 0.0
+    correct = 0
+    arm_counts = np.zeros(N_ARMS, dtype=np.int64)
+    started = time.perf_counter()
+    for _ in range(steps):
+        arms = bandit.choose()
+        p = probabilities[rows, arms]
+        rewards = rng.random(n_students) < p
+        bandit.update_all(arms, rewards)
+
+        regret += (probabilities.max(axis=1) - p).sum()
+        correct += rewards.sum()
+        arm_counts += np.bincount(arms, minlength=N_ARMS)
+
+        if drift:
+            # Learners improve: every level gets a little easier after each answer
+            probabilities = np.minimum(probabilities + drift * (1 - probabilities), 1.0)
+    elapsed = time.perf_counter() - started
+
+    answers = n_students * steps
+    return {
+        "policy": policy,
+        "params": params,
+        "students": n_students,
+        "steps": steps,
+        "mean_regret_per_student": round(regret / n_students, 4),
+        "regret_per_answer": round(regret / answers, 4),
+        "accuracy": round(correct / answers, 4),
+        "arm_share": {str(arm + 1): round(count / answers, 4) for arm, count in enumerate(arm_counts)},
+        "seconds": round(elapsed, 3),
+    }
+
+def parameter_grid(args):
+    """Every combination of the comma-separated tuning values given on the command line."""
+    values = {
+        "min_exploration": [int(v) for v in args.min_exploration.split(",")],
+        "exploit_prob": [float(v) for v in args.exploit_prob.split(",")],
+        "min_samples_for_exploit": [int(v) for v in args.min_samples_for_exploit.split(",")],
+        "epsilon": [float(v) for v in args.epsilon.split(",")],
+    }
+    names = list(values)
+    return [dict(zip(names, combo)) for combo in itertools.product(*values.values())]
+
+def relevant_params(policy, params):
+    if policy == "beta_mean":
+        return {k: params[k] for k in ("min_exploration", "exploit_prob", "min_samples_for_exploit")}
+    if policy == "epsilon_greedy":
+        return {"epsilon": params["epsilon"]}
+    return {}
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare bandit policies on simulated learners.")
+    parser.add_argument("--students", type=int, default=100000)
+    parser.add_argument("--steps", type=int, default=50, help="Answers per student (one term).")
+    parser.add_argument("--policies", default=",".join(POLICIES))
+    parser.add_argument("--replay", nargs="?", const=DATA_PATH,
+                        help="Fit learners from logged assessments (default: data/studentAssessments.json).")
+    parser.add_argument("--drift", type=float, default=0.0,
+                        help="Per-answer learning rate of the synthetic learners (0 = static).")
+    parser.add_argument("--decay", type=float, default=1.0, help="Forgetting factor, as BANDIT_DECAY.")
+    parser.add_argument("--min-exploration", default=str(DEFAULT_PARAMS["min_exploration"]))
+    parser.add_argument("--exploit-prob", default=str(DEFAULT_PARAMS["exploit_prob"]))
+    parser.add_argument("--min-samples-for-exploit", default=str(DEFAULT_PARAMS["min_samples_for_exploit"]))
+    parser.add_argument("--epsilon", default=str(DEFAULT_PARAMS["epsilon"]))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the JSON results to this file.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.replay:
+        try:
+            probabilities = replay_learners(args.replay, args.students, rng)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    else:
+        probabilities = success_probabilities(synthetic_learners(args.students, rng))
+
+    results = []
+    seen = set()
+    for policy in args.policies.split(","):
+        for params in parameter_grid(args):
+            params = relevant_params(policy, params)
+            key = (policy, tuple(sorted(params.items())))
+            if key in seen:
+                continue
+            seen.add(key)
+
+            # Same seed for every run: all policies face the same learners and the same coin flips
+            result = simulate(probabilities, args.steps, policy, args.seed,
+                              drift=args.drift, decay=args.decay, **params)
+            results.append(result)
+            print(f"{policy:15s} {json.dumps(params):80s} regret/student={result['mean_regret_per_student']:.3f} "
+                  f"accuracy={result['accuracy']:.3f} ({result['seconds']}s)")
+
+    results.sort(key=lambda r: r["mean_regret_per_student"])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+# WSGI entry point for running the bandit service under a pre-fork server:
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# `python app.py` remains the single-process development server.
+from app import app
@@ -0,0 +1,53 @@
+# ndjson_stream.py
+# Newline-delimited JSON streaming shared by the classifier scripts: questions are read
+# one per line, classified a batch at a time, and each prediction is written (and
+# flushed) as soon as its batch finishes, so memory stays flat however long the input is.
+import sys
+import json
+
+def read_batches(stream, batch_size):
+    """Yield lists of up to batch_size parsed objects; blank lines are skipped, bad ones become {"_error": ...}."""
+    batch = []
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        # Keep positions aligned with the input: a bad line gets an error result
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            item = {"_error": f"Line {line_number}: invalid JSON ({str(e)})"}
+        if not isinstance(item, dict):
+            item = {"_error": f"Line {line_number}: expected a JSON object, got {type(item).__name__}"}
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def stream_classify(classify_batch, batch_size, stream_in=None, stream_out=None, fallback=None):
+    """
+    Run classify_batch over stdin NDJSON and write one prediction per input line.
+    If a batch fails, fallback(item) supplies its results so the stream keeps going.
+    Returns the number of items written.
+    """
+    stream_in = stream_in or sys.stdin
+    stream_out = stream_out or sys.stdout
+    written = 0
+
+    for batch in read_batches(stream_in, batch_size):
+        valid = [item for item in batch if "_error" not in item]
+        try:
+            results = iter(classify_batch(valid) if valid else [])
+        except Exception as e:
+            print(f"Batch classification failed: {str(e)}", file=sys.stderr)
+            results = iter([fallback(item) if fallback else {"error": str(e)} for item in valid])
+
+        for item in batch:
+            result = {"error": item["_error"]} if "_error" in item else next(results)
+            stream_out.write(json.dumps(result) + "\n")
+            written += 1
+        stream_out.flush()
+
+    return written
@@ -0,0 +1,185 @@
+# prediction_cache.py
+# Persistent, content-addressed cache in front of the question classifiers.
+#
+# Keys are sha256(namespace + model fingerprint + format_input(question, options)), so the
+# same question re-uploaded in another assessment or term is answered without inference.
+# The fingerprint is derived from the model artifacts on disk: retraining changes it, and
+# entries written under an older fingerprint are purged the next time the cache is opened.
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+
+ScriptDir = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    'PREDICTION_CACHE_PATH', os.path.join(ScriptDir, 'cache', 'predictions.db'))
+DEFAULT_MAX_ENTRIES = int(os.environ.get('PREDICTION_CACHE_MAX_ENTRIES', 200000))
+
+# Files smaller than this are hashed by content; larger ones (model weights) by size + mtime
+FINGERPRINT_CONTENT_LIMIT = 1024 * 1024
+
+def model_fingerprint(*paths):
+    """Fingerprint a set of model files or directories (missing paths are skipped)."""
+    digest = hashlib.sha256()
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                full = os.path.join(path, name)
+                if os.path.isfile(full):
+                    files.append(full)
+        elif os.path.isfile(path):
+            files.append(path)
+
+    for full in files:
+        stat = os.stat(full)
+        digest.update(os.path.basename(full).encode())
+        digest.update(str(stat.st_size).encode())
+        if stat.st_size <= FINGERPRINT_CONTENT_LIMIT:
+            with open(full, 'rb') as f:
+                digest.update(f.read())
+        else:
+            digest.update(str(stat.st_mtime_ns).encode())
+
+    return digest.hexdigest()
+
+class PredictionCache:
+    """Size-bounded LRU cache of classifier outputs stored in a single SQLite file."""
+
+    def __init__(self, fingerprint, namespace='default', path=DEFAULT_CACHE_PATH,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.fingerprint = fingerprint
+        self.namespace = namespace
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS predictions (
+                key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                value TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_predictions_lru ON predictions (last_used)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_predictions_ns ON predictions (namespace, fingerprint)")
+
+        # A retrained model gets a new fingerprint: drop what the old one produced
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM predictions WHERE namespace = ? AND fingerprint != ?",
+                (namespace, fingerprint))
+
+    def key(self, text):
+        payload = f"{self.namespace}\0{self.fingerprint}\0{text}".encode('utf-8')
+        return hashlib.sha256(payload).hexdigest()
+
+    def get_many(self, texts):
+        """Return {index: cached prediction} for the texts that are cached."""
+        keys = [self.key(text) for text in texts]
+        found = {}
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT key, value FROM predictions WHERE key IN ({placeholders})", chunk).fetchall()
+            found.update(rows)
+
+        results = {}
+        for i, key in enumerate(keys):
+            if key in found:
+                results[i] = json.loads(found[key])
+
+        self.hits += len(results)
+        self.misses += len(keys) - len(results)
+
+        if results:
+            now = time.time()
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE predictions SET last_used = ? WHERE key = ?",
+                    [(now, keys[i]) for i in results])
+        return results
+
+    def put_many(self, texts, values):
+        now = time.time()
+        # Fallback/mock answers are never cached, so they can't outlive the outage
+        rows = [(self.key(text), self.namespace, self.fingerprint, json.dumps(value), now)
+                for text, value in zip(texts, values) if not value.get('mock')]
+        if not rows:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO predictions (key, namespace, fingerprint, value, last_used) "
+                "VALUES (?, ?, ?, ?, ?)", rows)
+        self.evict()
+
+    def evict(self):
+        """Drop the least recently used entries beyond max_entries."""
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM predictions").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            with self.conn:
+                self.conn.execute(
+                    "DELETE FROM predictions WHERE key IN "
+                    "(SELECT key FROM predictions ORDER BY last_used ASC LIMIT ?)", (overflow,))
+
+    def stats(self):
+        (entries,) = self.conn.execute(
+            "SELECT COUNT(*) FROM predictions WHERE namespace = ?", (self.namespace,)).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries
+        }
+
+    def clear(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM predictions WHERE namespace = ?", (self.namespace,))
+
+    def close(self):
+        self.conn.close()
+
+def open_cache(fingerprint_paths, namespace, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+    """Open the cache for a classifier, or return None (caching disabled) if that fails."""
+    try:
+        return PredictionCache(model_fingerprint(*fingerprint_paths), namespace, path, max_entries)
+    except Exception as e:
+        print(f"Prediction cache unavailable: {str(e)}", file=sys.stderr)
+        return None
+
+def cached_predict(cache, texts, compute):
+    """
+    Answer texts from the cache and call compute(miss_indices) only for the rest.
+    compute returns predictions in the order of miss_indices; they are stored and
+    merged back so the result lines up with texts.
+    """
+    if cache is None:
+        return compute(list(range(len(texts))))
+
+    results = [None] * len(texts)
+    for i, value in cache.get_many(texts).items():
+        results[i] = value
+
+    missing = [i for i, value in enumerate(results) if value is None]
+    if missing:
+        computed = compute(missing)
+        for i, value in zip(missing, computed):
+            results[i] = value
+        cache.put_many([texts[i] for i in missing], computed)
+
+    return results
@@ -0,0 +1,19 @@
+# question_format.py
+# Shared text formatting for the question classifiers. Kept free of heavy imports so
+# the lightweight TF-IDF path and the prediction cache can use it without pulling in torch.
+
+def format_input(question, options):
+    """Format the input as expected by the model."""
+    # Expected format:
+    # Question: <question_text>
+    # A: <optionA>
+    # B: <optionB>
+    # C: <optionC>
+    # D: <optionD>
+
+    formatted = f"Question: {question}\n"
+    labels = ['A', 'B', 'C', 'D']
+    for i, opt in enumerate(options):
+        if i < 4:
+            formatted += f"{labels[i]}: {opt}\n"
+    return formatted.strip()
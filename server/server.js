@@ -19,6 +19,7 @@ const facultyRoutes = require('./routes/facultyRoutes');
 const assessmentRoutes = require('./routes/assessmentRoutes');
 const questionRoutes = require('./routes/questionRoutes');
 const testRoutes = require('./routes/testRoutes');
+const classifierService = require('./services/classifierService');
 
 
 const app = express();
@@ -98,8 +99,16 @@ app.use('/api', assessmentRoutes(pool)); // /api/assessment
 app.use('/api/questions', questionRoutes(pool)); // /api/questions/upload
 app.use('/api', testRoutes(pool));
 
+// AI classifier worker readiness/health
+app.get('/api/classifier/health', async (req, res) => {
+    const health = await classifierService.health();
+    res.status(health.status === 'ok' ? 200 : 503).json(health);
+});
+
 // Legacy/Admin Deactivate Routes - Refactored to adminRoutes
 
 app.listen(PORT, () => {
     console.log(`Server running on port ${PORT}`);
+    // Load the classifier model in the background so the first upload doesn't pay for it
+    classifierService.warmUp();
 });
\ No newline at end of file
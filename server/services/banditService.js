@@ -6,23 +6,125 @@ if (!MAB_BASE_URL) {
   throw new Error("MAB_BASE_URL is not defined");
 }
 
+// When > 0, calls arriving within this many ms are coalesced into one
+// /question/next/batch or /answer/batch request (e.g. a whole class starting a test).
+const BATCH_WINDOW_MS = Number(process.env.MAB_BATCH_WINDOW_MS) || 0;
+const MAX_BATCH_SIZE = Number(process.env.MAB_MAX_BATCH_SIZE) || 500;
+
+// When set, /answer also returns the next difficulty; it is kept here and handed to the
+// following getNextDifficulty for that student, which then skips its own round trip.
+const RETURN_NEXT = process.env.MAB_RETURN_NEXT === "1";
+// Hints go stale (the student left, or their bandit moved on elsewhere): expire them and cap the map
+const HINT_TTL_MS = Number(process.env.MAB_HINT_TTL_MS) || 10 * 60 * 1000;
+const MAX_HINTS = Number(process.env.MAB_MAX_HINTS) || 10000;
+const nextDifficultyHints = new Map();
+
+function setHint(studentId, difficulty) {
+    // Re-inserting keeps the Map in insertion order, oldest first
+    nextDifficultyHints.delete(studentId);
+    nextDifficultyHints.set(studentId, { difficulty, expiresAt: Date.now() + HINT_TTL_MS });
+    while (nextDifficultyHints.size > MAX_HINTS) {
+        nextDifficultyHints.delete(nextDifficultyHints.keys().next().value);
+    }
+}
+
+function takeHint(studentId) {
+    const hint = nextDifficultyHints.get(studentId);
+    if (!hint) return undefined;
+    nextDifficultyHints.delete(studentId);
+    return hint.expiresAt > Date.now() ? hint.difficulty : undefined;
+}
+
+function createBatcher(send) {
+    let queue = [];
+    let timer = null;
+
+    const flush = async () => {
+        const batch = queue;
+        queue = [];
+        timer = null;
+        try {
+            const results = await send(batch.map(entry => entry.item));
+            batch.forEach((entry, i) => {
+                const result = results[i];
+                if (!result || result.error) entry.reject(new Error((result && result.error) || "Missing batch result"));
+                else entry.resolve(result);
+            });
+        } catch (err) {
+            batch.forEach(entry => entry.reject(err));
+        }
+    };
+
+    return (item) => new Promise((resolve, reject) => {
+        queue.push({ item, resolve, reject });
+        if (queue.length >= MAX_BATCH_SIZE) {
+            clearTimeout(timer);
+            flush();
+        } else if (!timer) {
+            timer = setTimeout(flush, BATCH_WINDOW_MS);
+        }
+    });
+}
+
+const queueNextDifficulty = createBatcher(async (studentIds) => {
+    const res = await axios.post(`${MAB_BASE_URL}/question/next/batch`, { student_ids: studentIds });
+    return res.data.results;
+});
+
+const queueAnswer = createBatcher(async (answers) => {
+    const res = await axios.post(`${MAB_BASE_URL}/answer/batch`, { answers, return_next: RETURN_NEXT });
+    return res.data.results;
+});
+
 module.exports = {
     getNextDifficulty: async (studentId) => {
+        const hinted = takeHint(studentId);
+        if (hinted !== undefined) return hinted;
+        if (BATCH_WINDOW_MS > 0) {
+            const result = await queueNextDifficulty(studentId);
+            return result.next_difficulty;
+        }
         const res = await axios.get(`${MAB_BASE_URL}/question/next`, {
-            params: { student_id: studentId } 
+            params: { student_id: studentId }
         });
         return res.data.next_difficulty;
     },
 
     submitToBandit: async (studentId, difficulty, reward) => {
-        return axios.post(`${MAB_BASE_URL}/answer`, {
-            student_id: studentId,       
-            decision: difficulty.toString(),
-            reward: reward
+        nextDifficultyHints.delete(studentId);
+        const answer = { student_id: studentId, decision: difficulty.toString(), reward: reward };
+        let res;
+        let nextDifficulty;
+        if (BATCH_WINDOW_MS > 0) {
+            res = await queueAnswer(answer);
+            nextDifficulty = res.next_difficulty;
+        } else {
+            res = await axios.post(`${MAB_BASE_URL}/answer`, { ...answer, return_next: RETURN_NEXT });
+            nextDifficulty = res.data.next_difficulty;
+        }
+        if (RETURN_NEXT && nextDifficulty !== undefined) setHint(studentId, nextDifficulty);
+        return res;
+    },
+
+    getNextDifficultyBatch: async (studentIds) => {
+        const res = await axios.post(`${MAB_BASE_URL}/question/next/batch`, { student_ids: studentIds });
+        return res.data.results;
+    },
+
+    submitToBanditBatch: async (answers) => {
+        const res = await axios.post(`${MAB_BASE_URL}/answer/batch`, {
+            answers: answers.map(a => ({
+                student_id: a.studentId,
+                decision: a.difficulty.toString(),
+                reward: a.reward
+            }))
         });
+        return res.data.results;
     },
 
     resetBandit: async (studentId) => {
+        // A hint was chosen from the state being wiped
+        nextDifficultyHints.delete(studentId);
         try {
             await axios.post(`${MAB_BASE_URL}/reset`, {
             student_id: studentId
@@ -31,4 +133,4 @@ module.exports = {
             console.error("Bandit reset failed:", err.message);
         }
     }
-};  
+};
@@ -0,0 +1,215 @@
+const path = require('path');
+const fs = require('fs');
+const { spawn } = require('child_process');
+
+// Long-lived transformer_classifier.py worker. The model is loaded once when the
+// worker starts, so each upload only pays for inference instead of interpreter
+// start-up + model load.
+const SCRIPT_PATH = path.join(__dirname, '..', 'transformer_classifier.py');
+const READY_TIMEOUT_MS = Number(process.env.CLASSIFIER_READY_TIMEOUT_MS) || 120000;
+const REQUEST_TIMEOUT_MS = Number(process.env.CLASSIFIER_REQUEST_TIMEOUT_MS) || 300000;
+
+let worker = null;
+let ready = null;
+let nextId = 1;
+const pending = new Map();
+
+function defaultsFor(questions) {
+    // Flagged like the Python fallbacks, so callers can tell them from real predictions
+    return questions.map(() => ({ topic: 'General Grammar', difficulty: 3, mock: true }));
+}
+
+function getPythonCmd() {
+    const pythonExecutable = process.platform === 'win32'
+        ? path.join(__dirname, '..', '..', 'venv', 'Scripts', 'python.exe')
+        : path.join(__dirname, '..', '..', 'venv', 'bin', 'python');
+
+    return fs.existsSync(pythonExecutable) ? pythonExecutable : 'python';
+}
+
+function failPending(reason) {
+    for (const [id, { resolve, timer }] of pending.entries()) {
+        clearTimeout(timer);
+        resolve({ id, error: reason });
+    }
+    pending.clear();
+}
+
+function workerArgs() {
+    const args = [SCRIPT_PATH, '--serve'];
+    if (process.env.CLASSIFIER_BATCH_SIZE) args.push('--batch-size', process.env.CLASSIFIER_BATCH_SIZE);
+    if (process.env.CLASSIFIER_MAX_LENGTH) args.push('--max-length', process.env.CLASSIFIER_MAX_LENGTH);
+    if (process.env.CLASSIFIER_BACKEND) args.push('--backend', process.env.CLASSIFIER_BACKEND);
+    if (process.env.CLASSIFIER_INTRA_OP_THREADS) args.push('--intra-op-threads', process.env.CLASSIFIER_INTRA_OP_THREADS);
+    if (process.env.CLASSIFIER_INTER_OP_THREADS) args.push('--inter-op-threads', process.env.CLASSIFIER_INTER_OP_THREADS);
+    if (process.env.CLASSIFIER_TOKEN_STORE === '1') args.push('--token-store');
+    // Large uploads are split across forked workers sharing the model's weights
+    if (process.env.CLASSIFIER_SHARDS) args.push('--shards', process.env.CLASSIFIER_SHARDS);
+    // Near-duplicate questions reuse the labels of indexed ones (see index() below)
+    if (process.env.CLASSIFIER_EMBEDDING_INDEX === '1') args.push('--embedding-index');
+    if (process.env.CLASSIFIER_SIMILARITY_THRESHOLD) args.push('--similarity-threshold', process.env.CLASSIFIER_SIMILARITY_THRESHOLD);
+    // Opt-in sampling profiler; collapsed stacks are written to this path when the worker exits
+    if (process.env.CLASSIFIER_PROFILE) args.push('--profile', process.env.CLASSIFIER_PROFILE);
+    return args;
+}
+
+function startWorker() {
+    if (ready) return ready;
+
+    const starting = new Promise((resolve, reject) => {
+        const proc = spawn(getPythonCmd(), workerArgs());
+        let buffer = '';
+        let isReady = false;
+
+        const readyTimer = setTimeout(() => {
+            if (!isReady) {
+                proc.kill();
+                reject(new Error('AI Classifier worker did not become ready in time'));
+            }
+        }, READY_TIMEOUT_MS);
+
+        proc.stdout.on('data', (data) => {
+            buffer += data.toString();
+            let newline;
+            while ((newline = buffer.indexOf('\n')) >= 0) {
+                const line = buffer.slice(0, newline).trim();
+                buffer = buffer.slice(newline + 1);
+                if (!line) continue;
+
+                let message;
+                try {
+                    message = JSON.parse(line);
+                } catch (e) {
+                    console.error(`Invalid JSON from AI worker: "${line}".`);
+                    continue;
+                }
+
+                if (!isReady) {
+                    if (message && message.status === 'ready') {
+                        isReady = true;
+                        clearTimeout(readyTimer);
+                        console.log(`AI Classifier worker ready (pid ${message.pid}).`);
+                        resolve(proc);
+                    } else {
+                        // Missing dependency / model load failure is reported before readiness
+                        clearTimeout(readyTimer);
+                        reject(new Error(`AI Classifier worker failed to start: ${line}`));
+                    }
+                    continue;
+                }
+
+                const entry = pending.get(message.id);
+                if (!entry) continue;
+                pending.delete(message.id);
+                clearTimeout(entry.timer);
+                entry.resolve(message);
+            }
+        });
+
+        proc.stderr.on('data', (data) => console.error(`AI Classifier: ${data.toString().trim()}`));
+
+        // Writing to a worker that just died raises EPIPE here; unhandled it would crash the server
+        proc.stdin.on('error', (err) => {
+            console.error(`AI Classifier worker stdin error: ${err.message}`);
+            if (worker === proc) worker = null;
+            ready = null;
+            failPending('worker unavailable');
+            proc.kill();
+        });
+
+        proc.on('error', (err) => {
+            clearTimeout(readyTimer);
+            console.error('Failed to spawn python:', err);
+            reject(err);
+        });
+
+        proc.on('close', (code) => {
+            clearTimeout(readyTimer);
+            console.warn(`AI Classifier worker exited with code ${code}.`);
+            if (worker === proc) worker = null;
+            ready = null;
+            failPending('worker exited');
+            if (!isReady) reject(new Error(`AI Classifier worker exited with code ${code}`));
+        });
+
+        worker = proc;
+    });
+
+    // Let the next call retry a fresh worker instead of caching the failure
+    starting.catch(() => { if (ready === starting) ready = null; });
+    ready = starting;
+    return ready;
+}
+
+function send(op, payload = {}) {
+    return startWorker().then((proc) => new Promise((resolve) => {
+        const id = nextId++;
+        if (!proc.stdin.writable) {
+            // The worker is going away; its close handler will reset it for the next call
+            resolve({ id, error: 'worker unavailable' });
+            return;
+        }
+        const timer = setTimeout(() => {
+            pending.delete(id);
+            console.warn(`AI Classifier request ${id} timed out. Using defaults.`);
+            resolve({ id, error: 'timeout' });
+        }, REQUEST_TIMEOUT_MS);
+
+        pending.set(id, { resolve, timer });
+        proc.stdin.write(JSON.stringify({ id, op, ...payload }) + '\n');
+    }));
+}
+
+module.exports = {
+    classify: async (questions) => {
+        if (!questions.length) return [];
+        try {
+            const reply = await send('classify', {
+                questions: questions.map(q => ({ question: q.text, options: q.options || [] }))
+            });
+            if (!reply || reply.error || !Array.isArray(reply.results)) {
+                console.warn(`AI Classifier error: ${reply && reply.error}. Using defaults.`);
+                return defaultsFor(questions);
+            }
+            return reply.results;
+        } catch (err) {
+            console.warn(`AI Classifier unavailable: ${err.message}. Using defaults.`);
+            return defaultsFor(questions);
+        }
+    },
+
+    // Add saved questions (with their final topic/difficulty) to the near-duplicate index
+    index: async (questions) => {
+        if (process.env.CLASSIFIER_EMBEDDING_INDEX !== '1' || !questions.length) return 0;
+        try {
+            const reply = await send('index', {
+                questions: questions.map(q => ({
+                    question: q.text,
+                    options: q.options || [],
+                    topic: q.topic,
+                    difficulty: q.difficulty
+                }))
+            });
+            if (reply.error) console.warn(`AI Classifier indexing error: ${reply.error}`);
+            return reply.indexed || 0;
+        } catch (err) {
+            console.warn(`AI Classifier indexing unavailable: ${err.message}`);
+            return 0;
+        }
+    },
+
+    health: async () => {
+        try {
+            return await send('health');
+        } catch (err) {
+            return { status: 'unavailable', error: err.message };
+        }
+    },
+
+    // Start loading the model ahead of the first upload
+    warmUp: () => startWorker().catch((err) => console.warn(`AI Classifier warm-up failed: ${err.message}`)),
+
+    shutdown: () => {
+        if (worker) worker.stdin.end(JSON.stringify({ id: nextId++, op: 'shutdown' }) + '\n');
+    }
+};
@@ -0,0 +1,106 @@
+# sharded_inference.py
+# Multi-process sharded classification for large uploads.
+#
+# One classifier process only ever uses one torch intra-op thread pool, and that pool
+# stops scaling well past a handful of threads. ShardPool forks worker processes right
+# after the model is loaded. The workers inherit the weights copy-on-write, so nothing is
+# reloaded or copied, because inference never writes to the parameter tensors. The host's
+# cores are split between the workers (threads per worker = cores // workers, one inter-op
+# thread each). A large upload is cut into contiguous chunks, the workers run the normal
+# predict() on them, and the results are merged back in input order.
+#
+# Forking needs the 'fork' start method (Linux). The pool forks on first use, before the
+# parent runs any forward pass of its own, since an OpenMP pool that is already running does
+# not survive fork; uploads too small to split then run in the parent. Where fork is
+# unavailable, or for the onnx backend (onnxruntime sessions are not fork-safe), the
+# caller keeps single-process inference.
+import os
+import sys
+import multiprocessing
+
+import torch
+
+from inference_metrics import TIMINGS
+
+# Chunks handed out per worker; more than one so a worker that draws long questions doesn't hold up the merge
+CHUNKS_PER_WORKER = 4
+
+# Set in the parent before forking and inherited by the workers (never pickled)
+_shared = {}
+
+def _init_worker(threads):
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Already initialised in this process; the intra-op split is what matters
+        pass
+
+def _predict_chunk(chunk):
+    return _shared['predict'](chunk, *_shared['args'])
+
+def fork_available():
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+class ShardPool:
+    """Forked workers sharing the parent's loaded model; predict() keeps input order."""
+
+    def __init__(self, workers, get_model, predict, batch_size, max_length,
+                 token_store=None, embedding_index=None, total_threads=None):
+        self.workers = workers
+        self.get_model = get_model
+        self.batch_size = batch_size
+        self.threads_per_worker = max(1, (total_threads or os.cpu_count() or 1) // workers)
+        # Items to gather before a split engages every worker (e.g. the --stream read size)
+        self.window = batch_size * workers * CHUNKS_PER_WORKER
+        _shared['predict'] = predict
+        _shared['options'] = (batch_size, max_length, token_store, embedding_index)
+        self._pool = None
+
+    def start(self):
+        """Load the model (via get_model) and fork the workers, once, before any forward pass."""
+        if self._pool is None:
+            tokenizer, model = self.get_model()
+            _shared['args'] = (tokenizer, model) + _shared['options']
+            self._pool = multiprocessing.get_context('fork').Pool(
+                self.workers, initializer=_init_worker, initargs=(self.threads_per_worker,))
+        return self
+
+    def chunks(self, questions_data):
+        """Contiguous slices, at least one batch each, about CHUNKS_PER_WORKER per worker."""
+        size = -(-len(questions_data) // (self.workers * CHUNKS_PER_WORKER))
+        size = max(size, self.batch_size)
+        return [questions_data[start:start + size] for start in range(0, len(questions_data), size)]
+
+    def predict(self, questions_data):
+        self.start()
+        chunks = self.chunks(questions_data)
+        if len(chunks) < 2:
+            return _predict_chunk(questions_data)
+
+        with TIMINGS.time("sharded", len(questions_data)):
+            results = []
+            # imap hands chunks to whichever worker is free but yields them in input order
+            for chunk_results in self._pool.imap(_predict_chunk, chunks):
+                results.extend(chunk_results)
+        return results
+
+    def status(self):
+        return {"workers": self.workers, "threads_per_worker": self.threads_per_worker,
+                "started": self._pool is not None}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+
+def open_shard_pool(workers, get_model, predict, batch_size, max_length,
+                    token_store=None, embedding_index=None, total_threads=None):
+    """A ShardPool, or None if sharding isn't possible here (inference then stays in-process)."""
+    if workers < 2:
+        return None
+    if not fork_available():
+        print("Sharded inference disabled: needs the 'fork' start method", file=sys.stderr)
+        return None
+    return ShardPool(workers, get_model, predict, batch_size, max_length,
+                     token_store, embedding_index, total_threads)
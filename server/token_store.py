@@ -0,0 +1,224 @@
+# token_store.py
+# Pre-tokenized, memory-mapped store of question encodings.
+#
+# Tokenizing with SentencePiece is repeated work for questions the system has already
+# seen. The store keeps every encoding the tokenizer returns (input_ids, attention_mask,
+# token_type_ids, ...) unpadded, one flat int32 file per key, plus an append-only index of
+# fixed-size records (16-byte question hash, offset, length). Reads are numpy memmap
+# slices, so a stored encoding is never copied into Python lists; only the padded batch
+# that goes into the model is materialised.
+#
+# A store directory belongs to one tokenizer fingerprint and one max_length, so changing
+# either simply starts a new directory. Appends are serialised with a lock file; the index
+# record is written after the data, so readers never see a half-written encoding.
+#
+#   python token_store.py data/assessments.json   # pre-tokenize a question bank
+import os
+import sys
+import json
+import hashlib
+import argparse
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: appends are then only safe from a single process
+    fcntl = None
+
+from question_format import format_input
+from prediction_cache import model_fingerprint
+
+ScriptDir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STORE_ROOT = os.environ.get('TOKEN_STORE_PATH', os.path.join(ScriptDir, 'cache', 'token_store'))
+
+TOKENIZER_FILES = ('spm.model', 'tokenizer_config.json', 'special_tokens_map.json', 'added_tokens.json')
+INDEX_DTYPE = np.dtype([('hash', 'V16'), ('offset', '<i8'), ('length', '<i4')])
+TOKEN_DTYPE = np.dtype('<i4')
+
+def text_hash(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+class TokenStore:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, 'meta.json')
+        self.keys = None
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.keys = json.load(f)['keys']
+        self._entries = {}
+        self._end = 0
+        self._index_size = 0
+        self._maps = {}
+        self._refresh_index()
+
+    def _data_path(self, key):
+        return os.path.join(self.path, f"{key}.bin")
+
+    def _index_path(self):
+        return os.path.join(self.path, 'index.bin')
+
+    def _refresh_index(self):
+        """Read index records appended since the last look (by this or another process)."""
+        path = self._index_path()
+        if not os.path.exists(path):
+            return
+        size = os.path.getsize(path)
+        # Ignore a trailing partial record; it will be complete on a later refresh
+        size -= size % INDEX_DTYPE.itemsize
+        if size <= self._index_size:
+            return
+        with open(path, 'rb') as f:
+            f.seek(self._index_size)
+            records = np.frombuffer(f.read(size - self._index_size), dtype=INDEX_DTYPE)
+        for record in records:
+            offset, length = int(record['offset']), int(record['length'])
+            self._entries[record['hash'].tobytes()] = (offset, length)
+            self._end = max(self._end, offset + length)
+        self._index_size = size
+
+    def _array(self, key, end):
+        """Memory map of a data file covering at least `end` tokens (remapped as the file grows)."""
+        mapped = self._maps.get(key)
+        if mapped is None or len(mapped) < end:
+            mapped = np.memmap(self._data_path(key), dtype=TOKEN_DTYPE, mode='r')
+            self._maps[key] = mapped
+        return mapped
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, text):
+        return text_hash(text) in self._entries
+
+    def get(self, text):
+        """{key: int32 view} for a stored text, or None. The views point into the mapped files."""
+        entry = self._entries.get(text_hash(text))
+        if entry is None:
+            return None
+        offset, length = entry
+        return {key: self._array(key, offset + length)[offset:offset + length] for key in self.keys}
+
+    def add(self, texts, encodings):
+        """Append tokenizer output (lists of unpadded sequences per key) for texts not stored yet."""
+        if not texts:
+            return
+        with open(os.path.join(self.path, '.lock'), 'w') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+
+            self._refresh_index()
+            if self.keys is None:
+                self.keys = sorted(encodings.keys())
+                with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+                    json.dump({'keys': self.keys}, f)
+
+            # Everything past the last indexed token is an interrupted append: drop it
+            end = self._end
+            for key in self.keys:
+                with open(self._data_path(key), 'ab') as f:
+                    f.truncate(end * TOKEN_DTYPE.itemsize)
+
+            records = []
+            data = {key: [] for key in self.keys}
+            seen = set()
+            for i, text in enumerate(texts):
+                digest = text_hash(text)
+                if digest in self._entries or digest in seen:
+                    continue
+                seen.add(digest)
+                length = len(encodings[self.keys[0]][i])
+                for key in self.keys:
+                    data[key].append(np.asarray(encodings[key][i], dtype=TOKEN_DTYPE))
+                records.append((digest, end, length))
+                end += length
+
+            if not records:
+                return
+            for key in self.keys:
+                with open(self._data_path(key), 'ab') as f:
+                    f.write(np.concatenate(data[key]).tobytes())
+            with open(self._index_path(), 'ab') as f:
+                f.write(np.array(records, dtype=INDEX_DTYPE).tobytes())
+            self._refresh_index()
+
+    def encode(self, texts, tokenizer, max_length):
+        """
+        Encodings for texts, tokenizing (and storing) only those not stored yet.
+        Returns {key: [int32 view per text]} in input order.
+        """
+        self._refresh_index()
+        missing = [text for text in dict.fromkeys(texts) if text_hash(text) not in self._entries]
+        if missing:
+            self.add(missing, tokenizer(missing, truncation=True, max_length=max_length))
+
+        stored = [self.get(text) for text in texts]
+        return {key: [entry[key] for entry in stored] for key in self.keys}
+
+    def iter_batches(self, texts, batch_size, pad_token_id=0, padding_side='right'):
+        """Padded numpy batches for stored texts, e.g. for a fine-tuning loop over the question bank."""
+        for start in range(0, len(texts), batch_size):
+            chunk = [self.get(text) for text in texts[start:start + batch_size]]
+            features = {key: [entry[key] for entry in chunk if entry is not None] for key in self.keys}
+            yield pad_batch(features, pad_token_id, padding_side)
+
+def pad_batch(features, pad_token_id=0, padding_side='right'):
+    """Pad {key: [1-D int arrays]} into {key: int64 (batch, longest) array}, like tokenizer.pad."""
+    longest = max(len(seq) for seq in features['input_ids'])
+    batch = {}
+    for key, sequences in features.items():
+        fill = pad_token_id if key == 'input_ids' else 0
+        out = np.full((len(sequences), longest), fill, dtype=np.int64)
+        for row, seq in enumerate(sequences):
+            if padding_side == 'left':
+                out[row, longest - len(seq):] = seq
+            else:
+                out[row, :len(seq)] = seq
+        batch[key] = out
+    return batch
+
+def store_path(tokenizer_dir, max_length, root=DEFAULT_STORE_ROOT):
+    fingerprint = model_fingerprint(*(os.path.join(tokenizer_dir, name) for name in TOKENIZER_FILES))
+    return os.path.join(root, f"{fingerprint[:16]}-{max_length}")
+
+def open_token_store(tokenizer_dir, max_length, root=DEFAULT_STORE_ROOT):
+    """The store for this tokenizer and max_length, or None if it can't be opened (tokenizing still works)."""
+    try:
+        return TokenStore(store_path(tokenizer_dir, max_length, root))
+    except (OSError, ValueError) as e:
+        print(f"Token store disabled: {str(e)}", file=sys.stderr)
+        return None
+
+def question_texts(data):
+    """Formatted inputs from {"questions": [...]} or a list of assessments with questions."""
+    if isinstance(data, dict):
+        data = [data]
+    texts = []
+    for item in data:
+        for q in item.get('questions', []):
+            text = q.get('question') or q.get('text') or ''
+            if text:
+                texts.append(format_input(text, q.get('options', [])))
+    return texts
+
+if __name__ == "__main__":
+    from transformers import AutoTokenizer
+    from transformer_classifier import ModelDir, DEFAULT_MAX_LENGTH
+
+    parser = argparse.ArgumentParser(description="Pre-tokenize a question bank into the token store.")
+    parser.add_argument('inputs', nargs='+', help="JSON files: {\"questions\": [...]} or a list of assessments.")
+    parser.add_argument('--max-length', type=int, default=DEFAULT_MAX_LENGTH)
+    parser.add_argument('--batch-size', type=int, default=1024)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(ModelDir)
+    store = TokenStore(store_path(ModelDir, args.max_length))
+    for path in args.inputs:
+        with open(path) as f:
+            texts = question_texts(json.load(f))
+        for start in range(0, len(texts), args.batch_size):
+            store.encode(texts[start:start + args.batch_size], tokenizer, args.max_length)
+    print(f"{len(store)} questions stored in {store.path}", file=sys.stderr)
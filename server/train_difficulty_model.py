@@ -1,15 +1,38 @@
 # train_difficulty_model.py
+#
+# Trains the TF-IDF difficulty model used by difficulty_classifier.py.
+#
+#   python train_difficulty_model.py                                  # built-in sample dataset
+#   python train_difficulty_model.py --data uploads/dataset.xlsx --search --jobs 8
+#
+# Large sources (.xlsx or .csv) are read in chunks and preprocessed in parallel by a
+# process pool while the next chunk is being read. Each run writes a versioned directory
+# (difficulty_models/<version>/: pickles, memory-mappable export and metadata.json) and,
+# unless --no-publish is given, atomically replaces the artifacts difficulty_classifier.py
+# loads, which picks them up on its next call (it reloads when their mtime changes).
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
 import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import train_test_split, GridSearchCV
+from sklearn.pipeline import Pipeline
 from sklearn.metrics import classification_report, accuracy_score
 import joblib
 import re
 from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
+from nltk.tokenize import NLTKWordTokenizer
 import nltk
 
+from difficulty_artifacts import MODEL_PATH, VECTORIZER_PATH, MMAP_PATH, export_mmap_artifacts
+
 # This robust check is kept for portability, but the manual download is the key fix.
 try:
     nltk.data.find('tokenizers/punkt')
@@ -19,17 +42,119 @@ except LookupError:
     # The script will exit if the manual download was not successful.
     sys.exit("Exiting: NLTK resources are essential for this script to run.")
 
+ScriptDir = os.path.dirname(os.path.abspath(__file__))
+VersionsDir = os.path.join(ScriptDir, 'difficulty_models')
+
+DEFAULT_CHUNK_SIZE = 20000
+TEXT_COLUMNS = ('question', 'questions', 'text')
+LABEL_COLUMNS = ('difficulty', 'label')
+
+# Grid for --search; every combination is cross-validated in parallel
+SEARCH_GRID = {
+    'tfidf__max_features': [5000, 20000, 50000],
+    'tfidf__ngram_range': [(1, 1), (1, 2)],
+    'clf__C': [0.3, 1.0, 3.0],
+}
+
+@lru_cache(maxsize=None)
+def stop_words():
+    """Loaded once per process instead of once per row."""
+    return frozenset(stopwords.words('english'))
+
+# word_tokenize() would first split sentences with punkt; punctuation is already stripped
+# by then, so going straight to its word tokenizer gives the same tokens, faster
+_word_tokenizer = NLTKWordTokenizer()
+
 def preprocess_text(text):
     """
     Cleans and preprocesses the input text.
     """
     text = text.lower()
     text = re.sub(r'[^\w\s]', '', text)
-    tokens = word_tokenize(text)
-    stop_words = set(stopwords.words('english'))
-    filtered_tokens = [word for word in tokens if word not in stop_words]
+    tokens = _word_tokenizer.tokenize(text)
+    stop = stop_words()
+    filtered_tokens = [word for word in tokens if word not in stop]
     return " ".join(filtered_tokens)
 
+def preprocess_batch(texts):
+    """Worker entry point: preprocess one chunk of texts."""
+    return [preprocess_text(str(text)) for text in texts]
+
+def normalize_label(label):
+    """'3', 3 and 3.0 (spreadsheets store numbers as floats) all become '3'; words are lowercased."""
+    if isinstance(label, float) and label.is_integer():
+        label = int(label)
+    return str(label).strip().lower()
+
+def find_column(columns, wanted, override=None):
+    normalized = {str(c).strip().lower(): c for c in columns}
+    for name in ([override.lower()] if override else wanted):
+        if name in normalized:
+            return normalized[name]
+    raise ValueError(f"None of the columns {list(columns)} matches {override or wanted}")
+
+def iter_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, text_column=None, label_column=None):
+    """Yield (texts, labels) chunks from a .csv or .xlsx file without loading it whole."""
+    if path.lower().endswith('.csv'):
+        for frame in pd.read_csv(path, chunksize=chunk_size):
+            text_col = find_column(frame.columns, TEXT_COLUMNS, text_column)
+            label_col = find_column(frame.columns, LABEL_COLUMNS, label_column)
+            frame = frame.dropna(subset=[text_col, label_col])
+            yield frame[text_col].astype(str).tolist(), [normalize_label(l) for l in frame[label_col]]
+        return
+
+    # pandas.read_excel has no chunksize; openpyxl's read-only mode streams the rows
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows)
+        text_idx = list(header).index(find_column(header, TEXT_COLUMNS, text_column))
+        label_idx = list(header).index(find_column(header, LABEL_COLUMNS, label_column))
+
+        texts, labels = [], []
+        for row in rows:
+            text, label = row[text_idx], row[label_idx]
+            if text is None or label is None or str(text).strip() == '':
+                continue
+            texts.append(str(text))
+            labels.append(normalize_label(label))
+            if len(texts) >= chunk_size:
+                yield texts, labels
+                texts, labels = [], []
+        if texts:
+            yield texts, labels
+    finally:
+        workbook.close()
+
+def load_dataset(path, chunk_size=DEFAULT_CHUNK_SIZE, jobs=None, text_column=None, label_column=None):
+    """
+    Read and preprocess a dataset chunk by chunk. Chunks are handed to a process pool as
+    they are read, with at most 2 * jobs in flight, so reading overlaps preprocessing and
+    memory stays bounded by a few chunks plus the (much smaller) processed text.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    # Smaller pieces than the read chunks keep every worker busy on modest files too
+    piece_size = max(1, min(chunk_size, 2000))
+
+    processed, labels = [], []
+    pending = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for texts, chunk_labels in iter_chunks(path, chunk_size, text_column, label_column):
+            for start in range(0, len(texts), piece_size):
+                pending.append((pool.submit(preprocess_batch, texts[start:start + piece_size]),
+                                chunk_labels[start:start + piece_size]))
+                while len(pending) > 2 * jobs:
+                    future, piece_labels = pending.pop(0)
+                    processed.extend(future.result())
+                    labels.extend(piece_labels)
+            print(f"Read {len(processed) + sum(len(l) for _, l in pending)} rows...", file=sys.stderr)
+        for future, piece_labels in pending:
+            processed.extend(future.result())
+            labels.extend(piece_labels)
+
+    return pd.DataFrame({'processed_question': processed, 'difficulty': labels})
+
 def create_english_grammar_vocabulary_dataset():
     """
     Creates a sample dataset of English grammar and vocabulary questions with difficulty labels.
@@ -51,20 +176,46 @@ def create_english_grammar_vocabulary_dataset():
     }
     return pd.DataFrame(data)
 
-def train_model(df):
+def search_hyperparameters(X, y, jobs=None, sample_size=50000, cv=3):
+    """
+    Cross-validate SEARCH_GRID with every fit running in parallel (n_jobs). On large data
+    the search runs on a stratified sample; the winner is refit on everything afterwards.
+    """
+    if len(X) > sample_size:
+        X, _, y, _ = train_test_split(X, y, train_size=sample_size, random_state=42, stratify=y)
+
+    pipeline = Pipeline([
+        ('tfidf', TfidfVectorizer()),
+        ('clf', LogisticRegression(max_iter=1000, random_state=42)),
+    ])
+    search = GridSearchCV(pipeline, SEARCH_GRID, cv=cv, scoring='f1_macro', n_jobs=jobs or -1, refit=False)
+    search.fit(X, y)
+    print(f"Best parameters: {search.best_params_} (f1_macro={search.best_score_:.3f})")
+    return search.best_params_, search.best_score_
+
+def train_model(df, search=False, jobs=None, search_sample=50000):
     """
     Trains a Logistic Regression model with TF-IDF features.
-    Saves the trained vectorizer and model using joblib.
+    Expects a 'processed_question' column, or a raw 'question' column to preprocess here.
     """
     print("Starting model training for English Grammar & Vocabulary...")
-    df['processed_question'] = df['question'].apply(preprocess_text)
+    if 'processed_question' not in df:
+        df['processed_question'] = df['question'].apply(preprocess_text)
     X = df['processed_question']
     y = df['difficulty']
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
-    vectorizer = TfidfVectorizer(max_features=5000)
+
+    params = {'tfidf__max_features': 5000, 'tfidf__ngram_range': (1, 1), 'clf__C': 1.0}
+    search_score = None
+    if search:
+        best, search_score = search_hyperparameters(X_train, y_train, jobs, search_sample)
+        params.update(best)
+
+    vectorizer = TfidfVectorizer(max_features=params['tfidf__max_features'],
+                                 ngram_range=params['tfidf__ngram_range'])
     X_train_vec = vectorizer.fit_transform(X_train)
     X_test_vec = vectorizer.transform(X_test)
-    model = LogisticRegression(max_iter=1000, random_state=42)
+    model = LogisticRegression(max_iter=1000, random_state=42, C=params['clf__C'])
     model.fit(X_train_vec, y_train)
     y_pred = model.predict(X_test_vec)
     accuracy = accuracy_score(y_test, y_pred)
@@ -73,11 +224,85 @@ def train_model(df):
     print(f"Training Accuracy: {accuracy:.2f}")
     print("Classification Report:\n", report)
     print("----------------------------")
-    joblib.dump(vectorizer, 'tfidf_vectorizer.pkl')
-    joblib.dump(model, 'difficulty_model.pkl')
-    print("\nVectorizer ('tfidf_vectorizer.pkl') and Model ('difficulty_model.pkl') saved successfully.")
-    return model, vectorizer
+
+    metrics = {
+        "accuracy": round(float(accuracy), 4),
+        "search_f1_macro": round(float(search_score), 4) if search_score is not None else None,
+        "train_rows": len(X_train),
+        "test_rows": len(X_test),
+        "params": {k: list(v) if isinstance(v, tuple) else v for k, v in params.items()},
+    }
+    return model, vectorizer, metrics
+
+def replace_atomically(src, dst):
+    """Copy src over dst so readers see either the old file or the new one, never half of it."""
+    tmp = f"{dst}.tmp{os.getpid()}"
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+def save_artifacts(model, vectorizer, metrics, source, version=None, publish=True):
+    """
+    Write difficulty_models/<version>/ (pickles, memory-mappable export, metadata.json) and
+    optionally publish it to the paths difficulty_classifier.py loads from.
+    """
+    version = version or time.strftime("%Y%m%d-%H%M%S")
+    out_dir = os.path.join(VersionsDir, version)
+    os.makedirs(out_dir, exist_ok=True)
+
+    model_path = os.path.join(out_dir, 'difficulty_model.pkl')
+    vectorizer_path = os.path.join(out_dir, 'tfidf_vectorizer.pkl')
+    mmap_path = os.path.join(out_dir, 'difficulty_artifacts.joblib')
+    joblib.dump(vectorizer, vectorizer_path)
+    joblib.dump(model, model_path)
+    export_mmap_artifacts(model, vectorizer, mmap_path)
+
+    metadata = {
+        "version": version,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "source": source,
+        "labels": [str(label) for label in model.classes_],
+        **metrics,
+    }
+    with open(os.path.join(out_dir, 'metadata.json'), 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+    if publish:
+        replace_atomically(vectorizer_path, VECTORIZER_PATH)
+        replace_atomically(model_path, MODEL_PATH)
+        replace_atomically(mmap_path, MMAP_PATH)
+        print(f"\nPublished version {version} to {os.path.dirname(os.path.abspath(MMAP_PATH))}")
+    print(f"Artifacts for version {version} saved in {out_dir}")
+    return out_dir
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train the TF-IDF difficulty model.")
+    parser.add_argument('--data', help="Training data (.xlsx or .csv); the built-in sample set otherwise.")
+    parser.add_argument('--text-column', help="Question column (default: question/questions/text).")
+    parser.add_argument('--label-column', help="Difficulty column (default: difficulty/label).")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Rows read per chunk (default: %(default)s).")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help="Worker processes for preprocessing and the search (default: all cores).")
+    parser.add_argument('--search', action='store_true',
+                        help="Cross-validate a parameter grid in parallel before the final fit.")
+    parser.add_argument('--search-sample', type=int, default=50000,
+                        help="Rows used for the search on large datasets (default: %(default)s).")
+    parser.add_argument('--version', help="Artifact version name (default: a timestamp).")
+    parser.add_argument('--no-publish', action='store_true',
+                        help="Only write difficulty_models/<version>/, leave the live artifacts alone.")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
-    df_grammar_vocab = create_english_grammar_vocabulary_dataset()
-    train_model(df_grammar_vocab)
\ No newline at end of file
+    args = parse_args()
+
+    started = time.perf_counter()
+    if args.data:
+        df = load_dataset(args.data, args.chunk_size, args.jobs, args.text_column, args.label_column)
+        source = os.path.abspath(args.data)
+    else:
+        df = create_english_grammar_vocabulary_dataset()
+        source = "built-in sample dataset"
+    print(f"Loaded {len(df)} rows in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    model, vectorizer, metrics = train_model(df, args.search, args.jobs, args.search_sample)
+    save_artifacts(model, vectorizer, metrics, source, args.version, publish=not args.no_publish)
@@ -2,146 +2,431 @@
 import sys
 import json
 import os
+import time
+import atexit
+import argparse
 
 try:
     import torch
     from transformers import AutoTokenizer, AutoModelForSequenceClassification
 except ImportError as e:
+    # Imported as a module (e.g. by the cascade): let the caller decide how to fall back
+    if __name__ != "__main__":
+        raise
     # If dependencies are missing, print fallback JSON and exit cleanly
     print(json.dumps([{"topic": "General Grammar", "difficulty": 3, "error": f"Missing dependency: {str(e)}", "mock": True}]))
     sys.exit(0)
 
+from question_format import format_input
+from prediction_cache import open_cache, cached_predict, DEFAULT_CACHE_PATH
+from ndjson_stream import stream_classify
+from inference_backends import BACKENDS, PARITY_SAMPLES, load_backend, export_artifacts, parity_check
+from inference_metrics import TIMINGS, SamplingProfiler
+from token_store import open_token_store, pad_batch
+from embedding_index import open_embedding_index, mean_pool, DEFAULT_SIMILARITY_THRESHOLD
+from sharded_inference import open_shard_pool
+
 # Set up paths
 ScriptDir = os.path.dirname(os.path.abspath(__file__))
 ModelDir = os.path.join(ScriptDir, 'ml_model')
 
+# Inference batching (overridable from the command line)
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_MAX_LENGTH = 512
+
 def load_model():
-    """Load the model and tokenizer from the local directory."""
+    """Load the model and tokenizer from the local directory; raises RuntimeError if they can't be loaded."""
     try:
-        tokenizer = AutoTokenizer.from_pretrained(ModelDir)
-        model = AutoModelForSequenceClassification.from_pretrained(ModelDir)
+        with TIMINGS.time("model_load"):
+            tokenizer = AutoTokenizer.from_pretrained(ModelDir)
+            model = AutoModelForSequenceClassification.from_pretrained(ModelDir)
         return tokenizer, model
     except Exception as e:
-        print(json.dumps({"error": f"Failed to load model: {str(e)}"}))
+        raise RuntimeError(f"Failed to load model: {str(e)}") from e
+
+def exit_on_load_error(load):
+    """Command-line entry points: report a model load failure as JSON on stdout and exit 1."""
+    try:
+        return load()
+    except RuntimeError as e:
+        print(json.dumps({"error": str(e)}))
         sys.exit(1)
 
-def format_input(question, options):
-    """Format the input as expected by the model."""
-    # Expected format:
-    # Question: <question_text>
-    # A: <optionA>
-    # B: <optionB>
-    # C: <optionC>
-    # D: <optionD>
-    
-    formatted = f"Question: {question}\n"
-    labels = ['A', 'B', 'C', 'D']
-    for i, opt in enumerate(options):
-        if i < 4:
-            formatted += f"{labels[i]}: {opt}\n"
-    return formatted.strip()
-
-def predict(questions_data, tokenizer, model):
-    """Run batch prediction on a list of questions."""
-    predictions = []
-    
+def load_classifier(backend='torch', intra_op_threads=None, inter_op_threads=None):
+    """Load the tokenizer and the model wrapped in the selected inference backend."""
+    tokenizer, model = load_model()
+    return tokenizer, load_backend(backend, model, intra_op_threads, inter_op_threads)
+
+def decode_logits(row_logits, id2label):
+    """Turn one row of model logits into a topic/difficulty prediction."""
+    # The checkpoint is loaded as a standard single-head AutoModelForSequenceClassification,
+    # so the logits carry the topic classification only. Difficulty has no head we can
+    # reach without the custom multi-task model class, so it stays at the neutral default.
+    topic = "Grammar" # Default
+    difficulty = 3 # Default
+
+    if row_logits.shape[-1] > 1:
+        # Classification
+        pred_idx = int(torch.argmax(row_logits, dim=-1).item())
+        topic = id2label.get(pred_idx, str(pred_idx))
+
+    return {
+        "topic": topic,
+        "difficulty": difficulty,
+        "raw_output": row_logits.unsqueeze(0).tolist() # Debug usage
+    }
+
+def length_buckets(lengths, batch_size):
+    """
+    Group item indices into batches of similar token length so padding is
+    only added up to the longest item of each batch, not of the whole upload.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+def run_batches(texts, tokenizer, model, batch_size=DEFAULT_BATCH_SIZE, max_length=DEFAULT_MAX_LENGTH,
+                token_store=None, pooled=False):
+    """
+    Tokenize texts once, then run the model per length bucket. Yields (bucket, logits,
+    embeddings) where bucket lists indices into texts and embeddings holds the pooled,
+    normalised sentence vectors (pooled=True) or None. With a token_store, encodings of
+    texts seen before are read from it instead of being tokenized again.
+    """
+    # Tokenize everything once without padding; each bucket is padded on its own below
+    with TIMINGS.time("tokenize", len(texts)):
+        if token_store is not None:
+            encodings = token_store.encode(texts, tokenizer, max_length)
+        else:
+            encodings = tokenizer(texts, truncation=True, max_length=max_length)
+    lengths = [len(ids) for ids in encodings['input_ids']]
+
+    for bucket in length_buckets(lengths, batch_size):
+        with TIMINGS.time("pad", len(bucket)):
+            features = {key: [encodings[key][k] for k in bucket] for key in encodings.keys()}
+            if token_store is not None:
+                # Stored encodings are memmap views: pad them straight into the batch arrays
+                padded = pad_batch(features, tokenizer.pad_token_id or 0, tokenizer.padding_side)
+                inputs = {key: torch.from_numpy(value) for key, value in padded.items()}
+            else:
+                inputs = tokenizer.pad(features, padding=True, return_tensors="pt")
+
+        with TIMINGS.time("forward", len(bucket)), torch.no_grad():
+            if pooled:
+                outputs = model(**inputs, output_hidden_states=True)
+                embeddings = mean_pool(outputs.hidden_states[-1], inputs['attention_mask'])
+            else:
+                outputs = model(**inputs)
+                embeddings = None
+
+        yield bucket, outputs.logits, embeddings
+
+def predict(questions_data, tokenizer, model, batch_size=DEFAULT_BATCH_SIZE, max_length=DEFAULT_MAX_LENGTH,
+            token_store=None, embedding_index=None):
+    """
+    Run batch prediction on a list of questions. With an embedding_index, a question close
+    enough to an indexed one takes over that question's saved topic and difficulty.
+    """
+    predictions = [None] * len(questions_data)
+
     # Map label indices to topics if your model outputs indices
     # NOTE: You might need to adjust this mapping based on your specific model training
-    # For now assuming the model output config handles the labels or we return the raw label
     id2label = model.config.id2label if hasattr(model.config, 'id2label') and model.config.id2label else {}
 
-    for item in questions_data:
+    indices = []
+    texts = []
+    for i, item in enumerate(questions_data):
         q_text = item.get('question', '')
         options = item.get('options', [])
-        
+
         if not q_text:
-            predictions.append({
+            predictions[i] = {
                 "topic": "General",
                 "difficulty": 3
-            })
+            }
             continue
 
-        formatted_text = format_input(q_text, options)
-        
-        inputs = tokenizer(formatted_text, return_tensors="pt", truncation=True, padding=True, max_length=512)
-        
-        with torch.no_grad():
-            outputs = model(**inputs)
-        
-        # Current model architecture description says:
-        # Tasks (Multi-Task Learning):
-        # Topic Classification (multi-class)
-        # Difficulty Prediction (regression)
-        
-        # We need to handle how the model outputs these two.
-        # usually simpler models output just logits.
-        # If this is a custom multi-task model, the output format depends on the specific architecture class.
-        # However, `AutoModelForSequenceClassification` usually outputs `logits`.
-        # If the model was trained with 2 heads, accessing them might require a specific class or looking at logits shape.
-        
-        # ASSUMPTION: The user provided `AutoModelForSequenceClassification`. 
-        # If it's a standard single-head model, it only does one thing.
-        # But the requirement says "Predicted Topic" AND "Predicted Difficulty".
-        # This implies either:
-        # A) Two separate models
-        # B) A custom model class
-        # C) The single model outputs everything in logits (concatenated)
-        
-        # Given the user just said "Base Model: microsoft/deberta-v3-base", 
-        # let's assume standard SequenceClassification behavior first, but check logits.
-        # If the user says "Output: topic + difficulty", and it's ONE model file, 
-        # it is likely a custom architecture OR the logits serve both purposes (unlikely for regression + classification mixture without custom head).
-        
-        # FALLBACK: logic for standard single-task classification.
-        # To strictly follow "Topic" and "Difficulty" from ONE model call without custom code provided by user,
-        # we might be making a leap.
-        # However, commonly for these assessments:
-        # Logits -> argmax -> Topic
-        # Difficulty might be a separate mapping or model.
-        
-        # WAIT: The user request said: "Tasks (Multi-Task Learning): Topic Classification... Difficulty Prediction..."
-        # AND "Input: question... Output: topic + difficulty".
-        # If I use `AutoModelForSequenceClassification`, it might not have the `.predict_heads` if it's custom.
-        
-        # Let's try to infer from logits.
-        # If the model is a standard HF AutoModelForSequenceClassification, it has one head.
-        # If the user replaced `config.json` it might define the architecture.
-        
-        # Let's write code that is safe:
-        logits = outputs.logits
-        
-        # Heuristic/Placeholder since we don't have the custom model definition file 'model.py' from the user:
-        # We will assume valid outputs or mock if structure is unexpected.
-        # Ideally we would import the specific model class if it was provided.
-        # Since it's not, we'll try to use the config.
-        
-        topic = "Grammar" # Default
-        difficulty = 3 # Default
-        
-        if logits.shape[-1] > 1:
-            # Classification
-            pred_idx = torch.argmax(logits, dim=-1).item()
-            topic = id2label.get(pred_idx, str(pred_idx))
-            
-            # If the model also does regression, usually it's a separate head.
-            # Without the custom class, we can't access it easily if it's not standard.
-            # WE WILL USE A HEURISTIC FOR DIFFICULTY based on the model if we can't get it,
-            # OR we assume the model output might be [topic_logits, difficulty_score].
-            
-            # Let's just return what we can. 
-            # If the user has a custom model class, they'd need to provide that python file too.
-            # For now, let's map the label to what we have.
-            pass
-            
-        predictions.append({
-            "topic": topic,
-            "difficulty": difficulty,
-            "raw_output": logits.tolist() # Debug usage
-        })
+        indices.append(i)
+        texts.append(format_input(q_text, options))
+
+    if not texts:
+        return predictions
+
+    pooled = embedding_index is not None
+    for bucket, logits, embeddings in run_batches(texts, tokenizer, model, batch_size, max_length,
+                                                  token_store, pooled):
+        matches = embedding_index.lookup(embeddings) if pooled else [None] * len(bucket)
+        for row, k in enumerate(bucket):
+            match = matches[row]
+            if match is not None:
+                predictions[indices[k]] = {
+                    "topic": match["topic"],
+                    "difficulty": match["difficulty"],
+                    "reused": True,
+                    "similarity": match["similarity"]
+                }
+            else:
+                predictions[indices[k]] = decode_logits(logits[row], id2label)
 
     return predictions
 
+def index_questions(questions_data, tokenizer, model, embedding_index, batch_size=DEFAULT_BATCH_SIZE,
+                    max_length=DEFAULT_MAX_LENGTH, token_store=None):
+    """Embed saved questions with their final topic/difficulty and insert them into the index."""
+    items = [item for item in questions_data
+             if item.get('question') and item.get('topic') is not None and item.get('difficulty') is not None]
+    if not items:
+        return 0
+
+    texts = [format_input(item['question'], item.get('options', [])) for item in items]
+    vectors = [None] * len(items)
+    for bucket, _, embeddings in run_batches(texts, tokenizer, model, batch_size, max_length, token_store, pooled=True):
+        for row, k in enumerate(bucket):
+            vectors[k] = embeddings[row]
+
+    labels = [{"topic": item['topic'], "difficulty": item['difficulty']} for item in items]
+    return embedding_index.add(texts, vectors, labels)
+
+def classify(questions_data, get_model, cache=None, batch_size=DEFAULT_BATCH_SIZE, max_length=DEFAULT_MAX_LENGTH,
+             token_store=None, embedding_index=None, shard_pool=None):
+    """
+    predict() behind the prediction cache. get_model() is only called when some
+    question misses the cache, so a fully cached upload never loads the model.
+    With a shard_pool, the misses are split across its forked workers instead.
+    """
+    texts = [format_input(item.get('question', ''), item.get('options', [])) for item in questions_data]
+
+    def compute(missing):
+        if shard_pool is not None:
+            return shard_pool.predict([questions_data[i] for i in missing])
+        tokenizer, model = get_model()
+        return predict([questions_data[i] for i in missing], tokenizer, model, batch_size, max_length,
+                       token_store, embedding_index)
+
+    return cached_predict(cache, texts, compute)
+
+def write_message(message, stream=None):
+    """Write one JSON message per line and flush so the caller sees it immediately."""
+    stream = stream or sys.stdout
+    stream.write(json.dumps(message) + "\n")
+    stream.flush()
+
+def serve(tokenizer, model, stream_in=None, stream_out=None, cache=None,
+          batch_size=DEFAULT_BATCH_SIZE, max_length=DEFAULT_MAX_LENGTH, profiler=None, token_store=None,
+          embedding_index=None, shard_pool=None):
+    """
+    Long-lived worker loop. The model is loaded once by the caller, then each
+    line on stdin is a JSON request and each reply is one JSON line on stdout:
+
+        {"id": 1, "op": "classify", "questions": [...]}  -> {"id": 1, "results": [...]}
+        {"id": 2, "op": "health"}                        -> {"id": 2, "status": "ok", "timings": {...}, ...}
+        {"id": 3, "op": "profile"}                       -> {"id": 3, "profiler": {...}} (writes the profile)
+        {"id": 4, "op": "index", "questions": [...]}     -> {"id": 4, "indexed": n} (questions with topic/difficulty)
+        {"id": 5, "op": "shutdown"}                      -> {"id": 5, "status": "bye"}
+    """
+    stream_in = stream_in or sys.stdin
+    started_at = time.time()
+    requests_served = 0
+    questions_served = 0
+
+    write_message({"status": "ready", "pid": os.getpid(), "model_dir": ModelDir}, stream_out)
+
+    for line in stream_in:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            message = json.loads(line)
+        except ValueError as e:
+            write_message({"id": None, "error": f"Invalid JSON: {str(e)}"}, stream_out)
+            continue
+        if not isinstance(message, dict):
+            write_message({"id": None, "error": "Invalid request: expected a JSON object"}, stream_out)
+            continue
+
+        request_id = message.get('id')
+        op = message.get('op', 'classify')
+
+        if op == 'health':
+            reply = {
+                "status": "ok",
+                "pid": os.getpid(),
+                "uptime_seconds": round(time.time() - started_at, 3),
+                "requests_served": requests_served,
+                "questions_served": questions_served,
+                "cache": cache.stats() if cache else None,
+                "token_store": {"path": token_store.path, "questions": len(token_store)} if token_store else None,
+                "embedding_index": {"path": embedding_index.path, "questions": len(embedding_index),
+                                    "threshold": embedding_index.threshold} if embedding_index else None,
+                "shards": shard_pool.status() if shard_pool else None,
+                "timings": TIMINGS.snapshot(),
+                "profiler": profiler.status() if profiler else None
+            }
+        elif op == 'index':
+            if embedding_index is None:
+                reply = {"error": "Embedding index not enabled (start the worker with --embedding-index)"}
+            else:
+                try:
+                    reply = {"indexed": index_questions(message.get('questions', []), tokenizer, model, embedding_index,
+                                                        batch_size, max_length, token_store)}
+                except Exception as e:
+                    print(f"Indexing failed: {str(e)}", file=sys.stderr)
+                    reply = {"error": f"Indexing failed: {str(e)}"}
+        elif op == 'profile':
+            if profiler:
+                try:
+                    profiler.dump()
+                    reply = {"profiler": profiler.status()}
+                except OSError as e:
+                    print(f"Writing the profile failed: {str(e)}", file=sys.stderr)
+                    reply = {"error": f"Writing the profile failed: {str(e)}"}
+            else:
+                reply = {"error": "Profiler not enabled (start the worker with --profile)"}
+        elif op == 'shutdown':
+            write_message({"id": request_id, "status": "bye"}, stream_out)
+            break
+        elif op == 'classify':
+            questions = message.get('questions', [])
+            try:
+                results = classify(questions, lambda: (tokenizer, model), cache, batch_size, max_length,
+                                   token_store, embedding_index, shard_pool)
+                reply = {"results": results}
+                requests_served += 1
+                questions_served += len(questions)
+            except Exception as e:
+                # Keep the worker alive; the caller falls back to defaults for this request only
+                print(f"Prediction failed: {str(e)}", file=sys.stderr)
+                reply = {"error": f"Prediction failed: {str(e)}"}
+        else:
+            reply = {"error": f"Unknown op: {op}"}
+
+        reply["id"] = request_id
+        write_message(reply, stream_out)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Classify assessment questions with the local DeBERTa model.")
+    parser.add_argument('--serve', action='store_true',
+                        help="Load the model once and answer newline-delimited JSON requests on stdin/stdout.")
+    parser.add_argument('--stream', action='store_true',
+                        help="Read one question per line (NDJSON) and write each prediction as its batch finishes.")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Questions per forward pass (default: %(default)s).")
+    parser.add_argument('--max-length', type=int, default=DEFAULT_MAX_LENGTH,
+                        help="Maximum tokens per question; longer inputs are truncated (default: %(default)s).")
+    parser.add_argument('--backend', choices=BACKENDS, default='torch',
+                        help="Inference backend (default: %(default)s).")
+    parser.add_argument('--intra-op-threads', type=int, default=None,
+                        help="Threads used inside a single operator (matmul etc.).")
+    parser.add_argument('--inter-op-threads', type=int, default=None,
+                        help="Threads used to run independent operators in parallel.")
+    parser.add_argument('--export', action='store_true',
+                        help="Write int8 and ONNX artifacts next to ml_model/, then run the parity check.")
+    parser.add_argument('--parity-check', action='store_true',
+                        help="Check that --backend predicts the same topics as the fp32 model.")
+    parser.add_argument('--parity-input',
+                        help="JSON file ({\"questions\": [...]}) for the parity check; built-in samples otherwise.")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Skip the on-disk prediction cache.")
+    parser.add_argument('--cache-path', default=DEFAULT_CACHE_PATH,
+                        help="Prediction cache file (default: %(default)s).")
+    parser.add_argument('--token-store', action='store_true',
+                        help="Reuse stored encodings of questions seen before (see token_store.py).")
+    parser.add_argument('--embedding-index', action='store_true',
+                        help="Reuse the saved labels of near-duplicate questions (see embedding_index.py); torch backends only.")
+    parser.add_argument('--similarity-threshold', type=float, default=DEFAULT_SIMILARITY_THRESHOLD,
+                        help="Cosine similarity at which a question counts as a near-duplicate (default: %(default)s).")
+    parser.add_argument('--shards', type=int, default=1,
+                        help="Worker processes sharing the loaded model for large uploads; the intra-op "
+                             "threads (default: all cores) are split between them. torch backends only.")
+    parser.add_argument('--profile', metavar='PATH',
+                        help="Run the sampling profiler and write collapsed stacks (flamegraph input) here on exit.")
+    parser.add_argument('--profile-interval-ms', type=float, default=5.0,
+                        help="Sampling interval of --profile (default: %(default)s).")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    args = parse_args()
+
+    profiler = None
+    if args.profile:
+        profiler = SamplingProfiler(args.profile, args.profile_interval_ms / 1000).start()
+        atexit.register(profiler.stop)
+
+    if args.export or args.parity_check:
+        tokenizer, reference = exit_on_load_error(load_model)
+        report = {}
+        if args.export:
+            report["export"] = export_artifacts(tokenizer, reference)
+
+        questions = PARITY_SAMPLES
+        if args.parity_input:
+            with open(args.parity_input) as f:
+                questions = json.load(f).get('questions', [])
+
+        backends = ['torch-int8', 'onnx'] if args.export else [args.backend]
+        report["parity"] = {}
+        for backend in backends:
+            candidate = load_backend(backend, reference, args.intra_op_threads, args.inter_op_threads)
+            report["parity"][backend] = parity_check(questions, tokenizer, reference, candidate, predict)
+
+        print(json.dumps(report, indent=2))
+        sys.exit(0 if all(not r["mismatches"] for r in report["parity"].values()) else 1)
+
+    token_store = open_token_store(ModelDir, args.max_length) if args.token_store else None
+
+    embedding_index = None
+    if args.embedding_index:
+        if args.backend == 'onnx':
+            # The exported graph only returns logits; pooling needs the hidden states
+            print("Embedding index disabled: not supported by the onnx backend", file=sys.stderr)
+        else:
+            with open(os.path.join(ModelDir, 'config.json')) as f:
+                hidden_size = json.load(f).get('hidden_size', 768)
+            embedding_index = open_embedding_index(ModelDir, hidden_size, args.similarity_threshold)
+
+    namespace = 'transformer' if args.backend == 'torch' else f"transformer:{args.backend}"
+    if embedding_index is not None:
+        # Results may carry reused labels; keep them apart from plain model predictions
+        namespace += ':reuse'
+    cache = None if args.no_cache else open_cache([ModelDir], namespace, args.cache_path)
+
+    loaded = []
+    def get_model():
+        # Loaded at most once, and only if some question misses the cache
+        if not loaded:
+            loaded.append(load_classifier(args.backend, args.intra_op_threads, args.inter_op_threads))
+        return loaded[0]
+
+    shard_pool = None
+    if args.shards > 1:
+        if args.backend == 'onnx':
+            # onnxruntime sessions (and their thread pools) are not safe to fork
+            print("Sharded inference disabled: not supported by the onnx backend", file=sys.stderr)
+        else:
+            shard_pool = open_shard_pool(args.shards, get_model, predict, args.batch_size, args.max_length,
+                                         token_store, embedding_index, args.intra_op_threads)
+            if shard_pool is not None:
+                atexit.register(shard_pool.close)
+
+    if args.serve:
+        tokenizer, model = exit_on_load_error(get_model)
+        if shard_pool is not None:
+            # Fork now, before any forward pass has started the parent's OpenMP threads
+            shard_pool.start()
+        serve(tokenizer, model, cache=cache, batch_size=args.batch_size, max_length=args.max_length,
+              profiler=profiler, token_store=token_store, embedding_index=embedding_index, shard_pool=shard_pool)
+        sys.exit(0)
+
+    if args.stream:
+        # With shards, read enough lines per round for every worker to get chunks
+        stream_classify(
+            lambda batch: classify(batch, get_model, cache, args.batch_size, args.max_length,
+                                   token_store, embedding_index, shard_pool),
+            shard_pool.window if shard_pool is not None else args.batch_size,
+            fallback=lambda item: {"topic": "General Grammar", "difficulty": 3, "mock": True, "error": "Model unavailable"}
+        )
+        sys.exit(0)
+
     try:
         # Read input from stdin
         input_data = sys.stdin.read()
@@ -159,8 +444,8 @@ if __name__ == "__main__":
             
         # Try to load model
         try:
-            tokenizer, model = load_model()
-            results = predict(questions, tokenizer, model)
+            results = classify(questions, get_model, cache, args.batch_size, args.max_length,
+                               token_store, embedding_index, shard_pool)
         except Exception as load_err:
             # IMPROVED ROBUSTNESS: 
             # If model loads fails, we return a SAFE default (Medium difficulty) 